@@ -0,0 +1,101 @@
+import os
+import time
+import random
+import cProfile
+import threading
+from contextlib import contextmanager
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+
+# Metrics and profiling shared by the speech service (speech-recognition/) and the NLP api
+# (nlp/ollama/api/). Both images are built from the repo root and copy this file next to
+# the app; in a checkout the apps add common/ to sys.path. Nothing here depends on Flask or
+# Quart: the apps call request_started/request_finished from their before/after request
+# hooks and serve metrics() on GET /metrics.
+#
+# Under a pre-forking server (gunicorn.conf.py) every worker has its own counters; with
+# PROMETHEUS_MULTIPROC_DIR set they are written to files there and metrics() adds up all
+# the workers, whichever one serves the scrape.
+MULTIPROCESS = bool(os.getenv('PROMETHEUS_MULTIPROC_DIR'))
+
+LATENCY_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+REQUEST_LATENCY = Histogram('http_request_duration_seconds', 'Latency of HTTP requests', ['endpoint', 'method', 'status'], buckets=LATENCY_BUCKETS)
+IN_FLIGHT = Gauge('http_requests_in_flight', 'Requests being handled', ['endpoint'], multiprocess_mode='livesum')
+# decode, vad, inference, extract, ollama_load, ollama_prompt_eval, ollama_eval, ...
+STAGE_LATENCY = Histogram('stage_duration_seconds', 'Time spent in one stage of a request', ['stage'], buckets=LATENCY_BUCKETS)
+TOKENS = Counter('llm_tokens_total', 'Tokens evaluated by the LLM', ['kind'])
+TOKENS_PER_S = Histogram('llm_generation_tokens_per_second', 'Generation speed of each LLM call', buckets=(1, 2.5, 5, 10, 20, 40, 80, 160, 320))
+QUEUE_DEPTH = Gauge('queue_depth', 'Work waiting in an internal queue', ['queue'])
+BATCH_SIZE = Histogram('batch_size', 'Inputs per batched model call', ['model'], buckets=(1, 2, 4, 8, 16, 32, 64))
+
+# Opt-in per-request profiling: with PROFILE_DIR set, a request carrying "X-Profile: 1"
+# (and a PROFILE_SAMPLE fraction of all the others) runs under cProfile and the stats are
+# written to PROFILE_DIR/<endpoint>-<timestamp>.prof, to open with pstats or snakeviz. Only
+# one request is profiled at a time (cProfile cannot nest), and in the async api the
+# profile also contains whatever other requests ran on the event loop meanwhile. For
+# whole-process sampling, attach py-spy from outside instead (py-spy record --pid <pid>).
+PROFILE_DIR = os.getenv('PROFILE_DIR')
+PROFILE_SAMPLE = float(os.getenv('PROFILE_SAMPLE', 0))
+profile_lock = threading.Lock()
+
+
+def observe_stage(stage, seconds):
+    STAGE_LATENCY.labels(stage).observe(seconds)
+
+
+@contextmanager
+def timed_stage(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+def observe_ollama(timings):
+    # The dict from ollama_client.ollama_timings()
+    for stage in ('load', 'prompt_eval', 'eval'):
+        observe_stage(f'ollama_{stage}', timings[f'{stage}_ms'] / 1000)
+    TOKENS.labels('prompt').inc(timings['prompt_tokens'])
+    TOKENS.labels('output').inc(timings['output_tokens'])
+    if timings['tokens_per_s']:
+        TOKENS_PER_S.observe(timings['tokens_per_s'])
+
+
+def track_queue(name, depth):
+    # `depth` is called on every scrape, which only reaches the worker serving it; the
+    # gauge is left out in multiprocess mode rather than report one worker's queue
+    if MULTIPROCESS:
+        return
+    QUEUE_DEPTH.labels(name).set_function(depth)
+
+
+def request_started(endpoint, headers):
+    IN_FLIGHT.labels(endpoint).inc()
+    profile = None
+    wanted = headers.get('X-Profile') == '1' or random.random() < PROFILE_SAMPLE
+    if PROFILE_DIR and wanted and profile_lock.acquire(blocking=False):
+        profile = cProfile.Profile()
+        profile.enable()
+    return endpoint, time.perf_counter(), profile
+
+
+def request_finished(token, method, status):
+    endpoint, start, profile = token
+    REQUEST_LATENCY.labels(endpoint, method, str(status)).observe(time.perf_counter() - start)
+    IN_FLIGHT.labels(endpoint).dec()
+    if profile is not None:
+        profile.disable()
+        profile_lock.release()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        name = endpoint.strip('/').replace('/', '_') or 'root'
+        profile.dump_stats(os.path.join(PROFILE_DIR, f'{name}-{time.strftime("%Y%m%d-%H%M%S")}-{int(start * 1000) % 1000:03d}.prof'))
+
+
+def metrics():
+    # Body and content type of the /metrics response
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,56 @@
+# Extractive QA engine vs the Ollama path on the nlp/* datasets.
+#
+#   python bench_qa.py [--qa-model deepset/roberta-base-squad2] [--ollama-model llama3.2:3b]
+#                      [--url http://localhost:11434] [--no-ollama]
+#
+# Latency and field accuracy (scoring.py) per dataset, only for the texts that have an
+# expected_N.json. The QA model is warmed up once before timing.
+import os
+import sys
+import time
+from prettytable import PrettyTable
+
+from models import discover, percentile, run_case
+from qa_engine import DEFAULT_MODEL, ExtractiveQA
+from scoring import calculate_accuracy
+
+
+def main(qa_model, ollama_model, url):
+    cases = [case for case in discover() if case[4] is not None]
+    engine = ExtractiveQA(qa_model)
+    engine.fill(cases[0][2], cases[0][3])
+
+    results = {}
+    for subpasta, texto_path, schema, texto, expected in cases:
+        row = results.setdefault(subpasta, {'qa_latency': [], 'qa_accuracy': [], 'llm_latency': [], 'llm_accuracy': []})
+
+        start = time.perf_counter()
+        filled = engine.fill(schema, texto)
+        row['qa_latency'].append(time.perf_counter() - start)
+        row['qa_accuracy'].append(calculate_accuracy(expected, filled))
+
+        if ollama_model:
+            run = run_case(url, ollama_model, subpasta, texto_path, schema, texto, expected)
+            if run['status'] == 'ok':
+                row['llm_latency'].append(run['latency_s'])
+                row['llm_accuracy'].append(run['accuracy'])
+            else:
+                print(f"{run['key']}: {run['error']}")
+
+    mean = lambda values: f"{sum(values) / len(values):.3f}" if values else '-'
+    p50 = lambda values: f"{percentile(values, 50) * 1000:.0f}" if values else '-'
+    table = PrettyTable()
+    table.field_names = ["Subpasta", "QA p50 (ms)", "QA accuracy", "LLM p50 (ms)", "LLM accuracy"]
+    for subpasta, row in results.items():
+        table.add_row([subpasta, p50(row['qa_latency']), mean(row['qa_accuracy']), p50(row['llm_latency']), mean(row['llm_accuracy'])])
+    print(table)
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    option = lambda name, default: args[args.index(name) + 1] if name in args else default
+    main(
+        option('--qa-model', DEFAULT_MODEL),
+        None if '--no-ollama' in args else option('--ollama-model', 'llama3.2:3b'),
+        option('--url', os.getenv('OLLAMA_URL', 'http://localhost:11434')),
+    )
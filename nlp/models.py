@@ -1,190 +1,213 @@
-from math import e
-from langsmith import expect
-import requests
+import os
+import sys
 import json
-import time 
+import time
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from prettytable import PrettyTable
-import os
+
+from scoring import aggregate, score
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ollama', 'api'))
+from schema_compiler import TEMPLATE_INSTRUCTIONS, compile_schema
 
 models = ["llama3:8b", "llama3.2:3b", "phi3.5:3.8b"]
 
-def compare_strings(key, value1, value2):
-    correct = value1.lower() == value2.lower()
-    print(f"Comparing field '{key}': Expected='{value1}', Generated='{value2}' -> {'Correct' if correct else 'Incorrect'}")
-    return correct
-
-def compare_lists(key, list1, list2):
-    if len(list1) != len(list2):
-        print(f"Comparing field '{key}': List lengths differ -> Incorrect")
-        return False
-    return all(compare_values(f"{key}[{i}]", v1, v2) for i, (v1, v2) in enumerate(zip(list1, list2)))
-
-def compare_dicts(key, dict1, dict2):
-    if dict1.keys() != dict2.keys():
-        print(f"Comparing field '{key}': Dictionary keys differ -> Incorrect")
-        return False
-    return all(compare_values(f"{key}.{k}", dict1[k], dict2[k]) for k in dict1)
-
-def compare_values(key, value1, value2):
-    # Se ambos são strings, compara ignorando maiúsculas/minúsculas
-    if isinstance(value1, str) and isinstance(value2, str):
-        return compare_strings(key, value1, value2)
-    # Se ambos são listas, compara cada elemento
-    elif isinstance(value1, list) and isinstance(value2, list):
-        return compare_lists(key, value1, value2)
-    # Se ambos são dicionários, compara chave por chave
-    elif isinstance(value1, dict) and isinstance(value2, dict):
-        return compare_dicts(key, value1, value2)
-    # Caso contrário, compara diretamente, incluindo valores None e booleanos
-    else:
-        correct = value1 == value2
-        print(f"Comparing field '{key}': Expected={value1}, Generated={value2} -> {'Correct' if correct else 'Incorrect'}")
-        return correct
-
-def count_values(data):
-    if isinstance(data, dict):
-        return sum(count_values(v) for v in data.values())
-    elif isinstance(data, list):
-        return sum(count_values(v) for v in data)
-    else:
-        return 1
-
-def count_correct(expected, generated, parent_key=""):
-    if isinstance(expected, dict) and isinstance(generated, dict):
-        return sum(count_correct(expected[k], generated.get(k), f"{parent_key}.{k}" if parent_key else k) for k in expected if k in generated)
-    elif isinstance(expected, list) and isinstance(generated, list):
-        return sum(count_correct(v1, v2, f"{parent_key}[{i}]" if parent_key else str(i)) for i, (v1, v2) in enumerate(zip(expected, generated)))
-    else:
-        return 1 if compare_values(parent_key, expected, generated) else 0
-
-def calculate_accuracy(expected, generated):
-    total_values = count_values(expected)
-    correct_values = count_correct(expected, generated)
-    print(total_values)
-    print(correct_values)
-    # Calcula a accuracy como a proporção de campos corretos
-    return correct_values / total_values if total_values > 0 else 0
-
-# Caminho da pasta principal
-base_dir = 'models'
-
-# Nomes das subpastas
+# Benchmark de extração: corre cada (subpasta x texto x modelo) contra o Ollama.
+#
+#   python models.py [--models llama3:8b,llama3.2:3b] [--concurrency 4] [--url http://localhost:11434]
+#                    [--store results/runs.jsonl] [--report results/report] [--compact]
+#
+# --compact sends the compiled schema template (schema_compiler.py) instead of the raw
+# schema; both variants live side by side in the store and the report, to compare prompt
+# tokens, latency and accuracy.
+#
+# Every finished run is appended to the store (JSONL) as soon as it completes, so an
+# interrupted sweep resumes where it stopped; delete the store to start over. Ollama only
+# runs requests in parallel up to its OLLAMA_NUM_PARALLEL, set it to at least --concurrency.
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
 subpastas = ['compras', 'creche', 'dados', 'feridas']
 
-schema_path = f'schema.json'
-
-
-# Loop por cada subpasta
-for subpasta in subpastas:
-    # Caminho completo da subpasta
-    subpasta_path = os.path.join(base_dir, subpasta)
-    
-    # Lista os arquivos dentro da subpasta
-    arquivos = sorted(os.listdir(subpasta_path))
-    schema_file_path = os.path.join(subpasta_path, schema_path)
-    
-    # Filtra e emparelha os arquivos JSON e TXT
-    for i in range(1, 4):
-        table = PrettyTable()
-        table.field_names = ["Modelo", "Tempo de Resposta", "Accuracy"]
-        
-        expected_path = f'expected_{i}.json'
-        texto_path = f'texto_{i}.txt'
-        
-        # Caminho completo para cada arquivo
-        #expected_file_path = os.path.join(subpasta_path, expected_path)
-        texto_file_path = os.path.join(subpasta_path, texto_path)
-        
-        # Verifica se ambos os arquivos existem
-        #if os.path.exists(expected_file_path) and 
-        if os.path.exists(texto_file_path) and os.path.exists(schema_file_path):
-            print(f"A acessar os ficheiros na pasta {subpasta}:")
-            print(f" - {expected_path}")
-            print(f" - {texto_path}")
-            
-            # Carregar o schema a partir de um arquivo JSON
-            #with open(expected_file_path, 'r') as expected_file:
-            #    expected = json.load(expected_file)
-
-            with open(schema_file_path, 'r') as schema_file:
-                schema = json.load(schema_file)
-
-            # Carregar o texto a partir de um arquivo .txt
-            with open(texto_file_path, 'r') as texto_file:
-                texto = texto_file.read()
-            
-            # Loop por cada modelo
-            for model in models:
-                payload = {
-                    "model": model,
-                    "messages": [
-                        {
-                            "role": "assistant",
-                            "content": f"You are an AI assistant with the main goal of extracting relevant informations from a text in order to fill a schema {schema}. For the fields that are not explicitly mentioned in the text, fill them with null. Do not logically infer for boolean fields, if the text does not mention the field, fill it with null. For example, for a field 'hasfever' if it does not mention 'has fever' clearly in the text, it should return 'hasfever':null. Ensure the output JSON is valid and complete. Return only the filled JSON, without any additional content"
-                            },
-                        {
-                            "role": "user",
-                            "content": texto
-                        }
-                    ],
-                    "format": "json",
-                    "stream": False,
-                    "options": {
-                        "seed": 123,
-                        "temperature": 0.01
-                    }
-                }
-
-
-                start_time = time.time()
-                
-                print("Requesting model", model)
-                
-                try:
-                    response= requests.post(
-                        "http://localhost:11434/api/chat",
-                        json= payload
-                    )
-                    end_time = time.time()
-
-                    response.raise_for_status()
-
-                    # A resposta já está em JSON, então podemos acessar diretamente
-                    formatted_response = response.json()["message"]["content"]
-                    #print(formatted_response)
-                    json_response = json.loads(formatted_response)
-
-                    #print("A comparar...")
-                    #accuracy = calculate_accuracy(expected, json_response)
-                    #print(accuracy)
-
-                    # Salva a resposta diretamente no arquivo
-                    file_name = f"./models/{subpasta}/res/{model}_{texto_path}_response.json"
-                    with open(file_name, 'w', encoding='utf-8') as f:
-                        json.dump(json_response, f, ensure_ascii=False, indent=4)  
-
-                    # Adiciona os resultados à tabela
-                    #table.add_row([model, end_time - start_time, accuracy])
-
-                except requests.exceptions.HTTPError as http_err:
-                    if response.status_code == 404:
-                        print(f"Erro 404: Recurso não encontrado. {http_err}")
-                    else:
-                        print(f"Erro HTTP: {http_err}")
-                except requests.exceptions.ConnectionError:
-                    print("Erro de conexão.")
-                except requests.exceptions.Timeout:
-                    print("Timeout.")
-                except requests.exceptions.RequestException as req_err:
-                    print(f"Erro relacionado à requisição: {req_err}")
-                except Exception as err:
-                    print(f"Ocorreu um erro inesperado: {err}")           
-            
-            #print(table)
-            csv_file = table.get_csv_string()
-            with open(f"./models/{subpasta}/res/{texto_path}_resultados.csv", "w") as f:
-                f.write(csv_file)
-
-            print(f"Os resultados para {subpasta} - {texto_path} foram salvos com sucesso!")
+PROMPT = "You are an AI assistant with the main goal of extracting relevant informations from a text in order to fill a schema {schema}. For the fields that are not explicitly mentioned in the text, fill them with null. Do not logically infer for boolean fields, if the text does not mention the field, fill it with null. For example, for a field 'hasfever' if it does not mention 'has fever' clearly in the text, it should return 'hasfever':null. Ensure the output JSON is valid and complete. Return only the filled JSON, without any additional content"
+
+sessions = threading.local()
+
+
+def load_json(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def discover():
+    # (subpasta, texto, schema, expected) for every texto_N.txt; expected is None when the
+    # dataset has no expected_N.json for it
+    cases = []
+    for subpasta in subpastas:
+        subpasta_path = os.path.join(base_dir, subpasta)
+        schema = load_json(os.path.join(subpasta_path, 'schema.json'))
+        textos = sorted(f for f in os.listdir(subpasta_path) if f.startswith('texto_') and f.endswith('.txt'))
+        for texto_path in textos:
+            expected_path = os.path.join(subpasta_path, texto_path.replace('texto_', 'expected_').replace('.txt', '.json'))
+            expected = load_json(expected_path) if os.path.exists(expected_path) else None
+            with open(os.path.join(subpasta_path, texto_path), 'r', encoding='utf-8') as texto_file:
+                cases.append((subpasta, texto_path, schema, texto_file.read(), expected))
+    return cases
+
+
+def run_key(subpasta, texto_path, model, prompt='raw'):
+    return f"{subpasta}/{texto_path}/{model}" + ('' if prompt == 'raw' else f"/{prompt}")
+
+
+def load_store(store_path):
+    # Latest run per combination; a successful run is never replaced by a later error
+    runs = {}
+    if os.path.exists(store_path):
+        with open(store_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    run = json.loads(line)
+                    if runs.get(run['key'], {}).get('status') != 'ok':
+                        runs[run['key']] = run
+    return runs
+
+
+def run_case(url, model, subpasta, texto_path, schema, texto, expected, prompt='raw'):
+    if not hasattr(sessions, 'session'):
+        sessions.session = requests.Session()
+
+    payload = {
+        "model": model,
+        "messages": [
+            {"role": "assistant", "content": TEMPLATE_INSTRUCTIONS + compile_schema(schema).prompt if prompt == 'compact' else PROMPT.format(schema=schema)},
+            {"role": "user", "content": texto}
+        ],
+        "format": "json",
+        "stream": False,
+        "options": {
+            "seed": 123,
+            "temperature": 0.01
+        }
+    }
+
+    run = {'key': run_key(subpasta, texto_path, model, prompt), 'subpasta': subpasta, 'texto': texto_path, 'model': model, 'prompt': prompt}
+    start_time = time.time()
+    try:
+        response = sessions.session.post(f"{url}/api/chat", json=payload, timeout=600)
+        response.raise_for_status()
+        body = response.json()
+        run['latency_s'] = time.time() - start_time
+        run['generated'] = json.loads(body["message"]["content"])
+        run['prompt_tokens'] = body.get('prompt_eval_count', 0)
+        run['output_tokens'] = body.get('eval_count', 0)
+        eval_s = body.get('eval_duration', 0) / 1e9
+        run['tokens_per_s'] = run['output_tokens'] / eval_s if eval_s else None
+        if expected is not None:
+            result = score(expected, run['generated'])
+            run['accuracy'] = result.correct / result.total if result.total else 0
+            run['mismatches'] = [leaf._asdict() for leaf in result.diff if not leaf.correct]
         else:
-            print(f"Erro ao encontrar os ficheiros na pasta {subpasta}.")
+            run['accuracy'] = None
+        run['status'] = 'ok'
+    except (requests.exceptions.RequestException, ValueError, KeyError) as err:
+        run['latency_s'] = time.time() - start_time
+        run['status'] = 'error'
+        run['error'] = str(err)
+    return run
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round((len(values) - 1) * p / 100)))] if values else None
+
+
+def summarize(runs, group_by):
+    groups = {}
+    for run in runs:
+        groups.setdefault(tuple(run[k] for k in group_by), []).append(run)
+
+    rows = []
+    for key, group in sorted(groups.items()):
+        ok = [run for run in group if run['status'] == 'ok']
+        latencies = [run['latency_s'] for run in ok]
+        speeds = [run['tokens_per_s'] for run in ok if run.get('tokens_per_s')]
+        accuracies = [run['accuracy'] for run in ok if run.get('accuracy') is not None]
+        prompt_tokens = [run['prompt_tokens'] for run in ok if run.get('prompt_tokens')]
+        rows.append({
+            **dict(zip(group_by, key)),
+            'runs': len(group),
+            'errors': len(group) - len(ok),
+            'latency_p50_s': percentile(latencies, 50),
+            'latency_p90_s': percentile(latencies, 90),
+            'latency_p99_s': percentile(latencies, 99),
+            'prompt_tokens': sum(prompt_tokens) / len(prompt_tokens) if prompt_tokens else None,
+            'tokens_per_s': sum(speeds) / len(speeds) if speeds else None,
+            'accuracy': sum(accuracies) / len(accuracies) if accuracies else None,
+        })
+    return rows
+
+
+def print_table(rows):
+    table = PrettyTable()
+    table.field_names = list(rows[0].keys())
+    for row in rows:
+        table.add_row([f"{v:.3f}" if isinstance(v, float) else v for v in row.values()])
+    print(table)
+    return table
+
+
+def main(models, concurrency, url, store_path, report_path, prompt):
+    os.makedirs(os.path.dirname(store_path) or '.', exist_ok=True)
+    done = {key for key, run in load_store(store_path).items() if run['status'] == 'ok'}
+    cases = discover()
+    todo = [(model, *case, prompt) for case in cases for model in models if run_key(case[0], case[1], model, prompt) not in done]
+    print(f"{len(cases) * len(models)} combinações, {len(todo)} por correr ({len(done)} já no store)")
+
+    with open(store_path, 'a', encoding='utf-8') as store, ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(run_case, url, *args) for args in todo]
+        for future in as_completed(futures):
+            run = future.result()
+            store.write(json.dumps(run, ensure_ascii=False) + '\n')
+            store.flush()
+            print(f"{run['key']}: {run['status']} {run['latency_s']:.1f}s accuracy={run.get('accuracy')}")
+
+    keys = {run_key(subpasta, texto_path, model, variant) for subpasta, texto_path, *_ in cases for model in models for variant in ('raw', 'compact')}
+    runs = [run for key, run in load_store(store_path).items() if key in keys]
+
+    for run in runs:
+        run.setdefault('prompt', 'raw')
+    per_model = summarize(runs, ['model', 'prompt'])
+    per_dataset = summarize(runs, ['model', 'prompt', 'subpasta'])
+    print_table(per_model)
+    table = print_table(per_dataset)
+
+    expected = {(subpasta, texto_path): expected for subpasta, texto_path, _, _, expected in cases}
+    # Field-level accuracy per model and dataset (field names repeat across datasets)
+    fields = {}
+    for model, variant in sorted({(run['model'], run['prompt']) for run in runs}):
+        for subpasta in subpastas:
+            pairs = [(expected[(run['subpasta'], run['texto'])], run['generated']) for run in runs
+                     if run['model'] == model and run['prompt'] == variant and run['subpasta'] == subpasta
+                     and run['status'] == 'ok' and expected[(run['subpasta'], run['texto'])] is not None]
+            if pairs:
+                fields.setdefault(f"{model}/{variant}", {})[subpasta] = aggregate(pairs)['fields']
+
+    with open(f"{report_path}.json", 'w', encoding='utf-8') as f:
+        json.dump({'models': per_model, 'datasets': per_dataset, 'fields': fields, 'runs': runs}, f, ensure_ascii=False, indent=4)
+    with open(f"{report_path}.csv", 'w', encoding='utf-8') as f:
+        f.write(table.get_csv_string())
+    print(f"Relatório guardado em {report_path}.json e {report_path}.csv")
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    option = lambda name, default: args[args.index(name) + 1] if name in args else default
+    main(
+        option('--models', ','.join(models)).split(','),
+        int(option('--concurrency', 4)),
+        option('--url', os.getenv('OLLAMA_URL', 'http://localhost:11434')),
+        option('--store', os.path.join(base_dir, 'results', 'runs.jsonl')),
+        option('--report', os.path.join(base_dir, 'results', 'report')),
+        'compact' if '--compact' in args else 'raw',
+    )
@@ -0,0 +1,117 @@
+import math
+import time
+import heapq
+import asyncio
+import itertools
+from contextlib import asynccontextmanager
+
+# Priorities, lower goes first
+PRIORITY_FIELDS = 0
+PRIORITY_SCHEMA = 1
+PRIORITY_BATCH = 2
+
+
+class Rejected(Exception):
+    # Raised instead of queueing without bound; status is 429 (queue full) or 503 (the
+    # deadline passed while waiting), retry_after_s an estimate for the Retry-After header
+    def __init__(self, status, message, retry_after_s):
+        super().__init__(message)
+        self.status = status
+        self.retry_after_s = retry_after_s
+
+
+class AdmissionController:
+    # At most `max_concurrency` calls go to Ollama at once and up to `max_queue` more wait
+    # for a slot in priority order (FIFO within a priority). Everything beyond that is
+    # rejected at once with a Retry-After estimate, rather than piling up inside Ollama
+    # where every request gets slower. The last `reserved` slots are kept for priority 0,
+    # so a burst of long /generate-schema calls cannot hold up the short /fields ones.
+    def __init__(self, max_concurrency=4, max_queue=32, reserved=1):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.reserved = min(reserved, max_concurrency - 1)
+        self.active = 0
+        self.waiting = []
+        self.order = itertools.count()
+        # Moving average of how long a slot is held, for the Retry-After estimate
+        self.service_s = 1.0
+        self.rejected = {'queue_full': 0, 'deadline': 0}
+
+    def _limit(self, priority):
+        return self.max_concurrency if priority == 0 else self.max_concurrency - self.reserved
+
+    def retry_after(self):
+        return max(1, math.ceil(self.service_s * (len(self.waiting) + 1) / self.max_concurrency))
+
+    def stats(self):
+        return {
+            'active': self.active,
+            'waiting': len(self.waiting),
+            'max_concurrency': self.max_concurrency,
+            'max_queue': self.max_queue,
+            'service_s': round(self.service_s, 3),
+            'rejected': dict(self.rejected),
+        }
+
+    def _free(self, priority):
+        # Nobody of the same or a higher priority is waiting, and a slot is free for it
+        return (not self.waiting or self.waiting[0][0] > priority) and self.active < self._limit(priority)
+
+    def check(self, priority):
+        # Raises the 429 acquire() would, without taking anything: for a stream that has to
+        # answer with a status before it starts, but only holds a slot once it is running
+        if not self._free(priority) and len(self.waiting) >= self.max_queue:
+            self.rejected['queue_full'] += 1
+            raise Rejected(429, 'Too many requests waiting for the model', self.retry_after())
+
+    async def acquire(self, priority, deadline):
+        # `deadline` is a time.monotonic() value; returns when the slot was granted
+        if self._free(priority):
+            self.active += 1
+            return time.monotonic()
+        self.check(priority)
+
+        granted = asyncio.get_running_loop().create_future()
+        entry = (priority, next(self.order), granted)
+        heapq.heappush(self.waiting, entry)
+        try:
+            await asyncio.wait({granted}, timeout=max(0, deadline - time.monotonic()))
+        except asyncio.CancelledError:
+            # The client went away while waiting
+            self._leave(entry)
+            raise
+        if not granted.done():
+            self._leave(entry)
+            self.rejected['deadline'] += 1
+            raise Rejected(503, 'Timed out waiting for the model', self.retry_after())
+        return time.monotonic()
+
+    def release(self, started):
+        self.service_s = 0.8 * self.service_s + 0.2 * (time.monotonic() - started)
+        self.active -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, priority, deadline):
+        started = await self.acquire(priority, deadline)
+        try:
+            yield
+        finally:
+            self.release(started)
+
+    def _leave(self, entry):
+        granted = entry[2]
+        if granted.done():
+            # The slot was handed over just as the wait ended, give it back
+            self.active -= 1
+            self._dispatch()
+            return
+        granted.cancel()
+        self.waiting.remove(entry)
+        heapq.heapify(self.waiting)
+
+    def _dispatch(self):
+        while self.waiting and self.active < self._limit(self.waiting[0][0]):
+            _, _, granted = heapq.heappop(self.waiting)
+            self.active += 1
+            granted.set_result(None)
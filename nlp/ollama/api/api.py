@@ -1,21 +1,162 @@
-from flask import Flask, request, jsonify
-import requests
+from quart import Quart, request, jsonify, g, make_response
+import httpx
 import json
+import os
+import sys
+import asyncio
+import time
+from collections import deque
 
-app = Flask(__name__)
+# instrumentation.py is shared with the speech service: next to this file in the image, in
+# common/ at the repo root in a checkout
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'common'))
+
+from admission import PRIORITY_BATCH, PRIORITY_FIELDS, PRIORITY_SCHEMA, AdmissionController, Rejected
+from cache import ResponseCache
+from cascade import field_confidence
+from instrumentation import metrics, observe_ollama, observe_stage, request_finished, request_started, track_queue
+from json_stream import JsonFieldStream
+from ollama_client import NoBackendError, OllamaClient, combine_timings, ollama_timings, server_timing
+from rules import prefill
+from schema_compiler import TEMPLATE_INSTRUCTIONS, compile_schema
+from sessions import SessionStore
+from streamed_body import StreamedHTTPConnection
+
+app = Quart(__name__)
+
+
+class GatewayHTTPConnection(StreamedHTTPConnection):
+    # Bodies read line by line as they arrive, without Quart's 16 MB / 60 s body limits
+    streamed_paths = frozenset({'/fields/batch'})
+
+
+app.asgi_http_class = GatewayHTTPConnection
 
 model = "llama3.2:3b"
-OLLAMA_URL = 'http://ollama:11434'
+num_ctx = int(os.getenv('OLLAMA_NUM_CTX', 4096))
+# Rule-based pre-extraction of the trivial fields before calling the model
+use_rules = os.getenv('RULES_FAST_PATH', '1') == '1'
+# Compact template instead of the raw schema in the prompt, and the number of top-level
+# fields above which a form is split into sections extracted in parallel (0 = never)
+compact_schema = os.getenv('SCHEMA_COMPACT', '1') == '1'
+section_size = int(os.getenv('SCHEMA_SECTION_SIZE', 0))
+# Constrain decoding to the form's JSON schema (Ollama structured outputs) instead of any
+# JSON, and how many times fields that still come back invalid are asked again
+structured_output = os.getenv('STRUCTURED_OUTPUT', '1') == '1'
+repair_attempts = int(os.getenv('REPAIR_ATTEMPTS', 1))
+# Cascade mode, "small,large": the small model answers every field first and only the ones
+# with a confidence under CASCADE_THRESHOLD (see cascade.py) are asked to the large one
+cascade_models = [name.strip() for name in os.getenv('CASCADE_MODELS', '').split(',') if name.strip()]
+cascade_threshold = float(os.getenv('CASCADE_THRESHOLD', 0.5))
+# Known forms, as <FORMS_DIR>/<form id>/schema.json (the layout of the nlp/* datasets), so
+# clients can send {"form": id} instead of the whole schema
+forms_dir = os.getenv('FORMS_DIR')
+ollama = OllamaClient()
+schema_cache = ResponseCache(
+    max_entries=int(os.getenv('SCHEMA_CACHE_SIZE', 256)),
+    ttl_s=float(os.getenv('SCHEMA_CACHE_TTL_S', 7 * 24 * 3600)),
+    disk_dir=os.getenv('SCHEMA_CACHE_DIR'),
+)
+# Bounded concurrency towards Ollama (OLLAMA_CONCURRENCY per node, match its
+# OLLAMA_NUM_PARALLEL) and a bounded queue in front of it; see admission.py
+admission = AdmissionController(
+    max_concurrency=int(os.getenv('OLLAMA_CONCURRENCY', 4)) * len(ollama.backends),
+    max_queue=int(os.getenv('ADMISSION_QUEUE_SIZE', 32)),
+    reserved=int(os.getenv('ADMISSION_RESERVED_FIELDS', 1)),
+)
+# How long a request may take overall, queueing included; clients can ask for less with an
+# X-Request-Timeout header (seconds)
+fields_deadline_s = float(os.getenv('FIELDS_DEADLINE_S', 60))
+schema_deadline_s = float(os.getenv('SCHEMA_DEADLINE_S', 300))
+# /fields/batch: texts extracted at the same time per batch, and the time one text may take
+batch_concurrency = int(os.getenv('BATCH_CONCURRENCY', 2))
+batch_item_deadline_s = float(os.getenv('BATCH_ITEM_DEADLINE_S', 300))
+# Dictation sessions (/sessions): the form filled so far, kept between utterances
+sessions = SessionStore(
+    max_sessions=int(os.getenv('SESSION_MAX', 1000)),
+    idle_ttl_s=float(os.getenv('SESSION_IDLE_TTL_S', 1800)),
+)
+for backend in ollama.backends:
+    track_queue(f'ollama_outstanding:{backend.url}', lambda backend=backend: backend.outstanding)
+track_queue('admission_waiting', lambda: len(admission.waiting))
 
-@app.route('/generate-schema', methods=['POST'])
-def generate_schema():
-    data = request.get_json()
-    form_code = data.get('formCode')
 
-    if not form_code:
-        return jsonify({'error': 'Form code is required'}), 400
+@app.before_serving
+async def startup():
+    await ollama.start()
+
+
+@app.after_serving
+async def shutdown():
+    await ollama.close()
+
+
+@app.before_request
+async def start_request_metrics():
+    # Labelled by route, not by path, so the number of series stays bounded
+    g.metrics = request_started(request.url_rule.rule if request.url_rule else 'unmatched', request.headers)
+
+
+@app.after_request
+async def record_request_metrics(response):
+    # Streamed responses are counted when the headers go out, not when the stream ends
+    if 'metrics' in g:
+        request_finished(g.pop('metrics'), request.method, response.status_code)
+    return response
+
+
+@app.teardown_request
+async def record_failed_request_metrics(error=None):
+    # after_request is skipped when the view raised
+    if 'metrics' in g:
+        request_finished(g.pop('metrics'), request.method, 500)
 
-    payload = {
+
+@app.errorhandler(Rejected)
+async def overloaded(e):
+    return jsonify({'error': str(e), 'retry_after_s': e.retry_after_s}), e.status, {'Retry-After': str(e.retry_after_s)}
+
+
+def request_deadline(default_s):
+    try:
+        timeout_s = min(float(request.headers.get('X-Request-Timeout', default_s)), default_s)
+    except ValueError:
+        timeout_s = default_s
+    return time.monotonic() + timeout_s
+
+
+async def call_ollama(payload, priority, deadline):
+    # Waits for an admission slot, then makes the call within what is left of the deadline
+    queued = time.monotonic()
+    async with admission.slot(priority, deadline):
+        observe_stage('admission_wait', time.monotonic() - queued)
+        async with asyncio.timeout(deadline - time.monotonic()):
+            return await ollama.chat(payload)
+
+
+@app.errorhandler(NoBackendError)
+async def no_backend(e):
+    return jsonify({'error': str(e)}), 503, {'Retry-After': str(max(1, int(ollama.health_interval)))}
+
+
+@app.route('/backends', methods=['GET'])
+async def backends():
+    return jsonify(ollama.stats())
+
+
+@app.route('/admission', methods=['GET'])
+async def admission_stats():
+    return jsonify(admission.stats())
+
+
+@app.route('/metrics', methods=['GET'])
+async def prometheus_metrics():
+    body, content_type = metrics()
+    return body, 200, {'Content-Type': content_type}
+
+
+def schema_payload(form_code):
+    return {
         'model': model,
         'messages': [
             {
@@ -34,58 +175,526 @@ def generate_schema():
         }
     }
 
+
+@app.route('/generate-schema', methods=['POST'])
+async def generate_schema():
+    data = await request.get_json()
+    form_code = data.get('formCode')
+
+    if not form_code:
+        return jsonify({'error': 'Form code is required'}), 400
+    deadline = request_deadline(schema_deadline_s)
+
+    payload = schema_payload(form_code)
+    # The payload holds the model, the prompt template, the form code and the options,
+    # so its hash changes whenever any of them does
+    cache_key = ResponseCache.key(payload)
+    content = schema_cache.get(cache_key)
+    if content:
+        return jsonify(content), 200, {'X-Cache': 'HIT'}
+
     try:
-        response = requests.post(f'{OLLAMA_URL}/api/chat', json=payload)
-        response.raise_for_status()  # Raise an error for bad responses
-        content = response.json().get('message', {}).get('content')
+        response = await call_ollama(payload, PRIORITY_SCHEMA, deadline)
+        observe_ollama(ollama_timings(response))
+        content = response.get('message', {}).get('content')
         if content:
             # Para testar
             json_schema = json.loads(content)
             print(json_schema)
-            return jsonify(content)
+            schema_cache.put(cache_key, content)
+            return jsonify(content), 200, {'X-Cache': 'MISS'}
 
-    except requests.RequestException as e:
+    except NoBackendError:
+        raise
+    except (httpx.TimeoutException, TimeoutError) as e:
+        return jsonify({'error': f'Model timed out: {e}'}), 504
+    except httpx.HTTPError as e:
         return jsonify({'error': str(e)}), 500
 
+    return jsonify({'error': 'Empty response from model'}), 502
 
-@app.route('/fields', methods=['POST'])
-def fields():
-    data = request.get_json()
-    schema = data.get('schema')
-    text = data.get('text')
 
-    payload = {
-        'model': model,
+@app.route('/generate-schema/cache', methods=['GET'])
+async def schema_cache_stats():
+    return jsonify(schema_cache.stats())
+
+
+# Drops the cached schema of one form ({"formCode": ...}) or, without a body, everything
+@app.route('/generate-schema/cache', methods=['DELETE'])
+async def invalidate_schema_cache():
+    data = await request.get_json(silent=True) or {}
+    form_code = data.get('formCode')
+    removed = schema_cache.invalidate(ResponseCache.key(schema_payload(form_code)) if form_code else None)
+    return jsonify({'removed': removed})
+
+
+# Everything before the user text must be byte-identical between calls for the same form,
+# so Ollama can reuse the KV cache of that prefix and only evaluate the new text: constant
+# instructions first, then the schema serialized the same way every time, then the text.
+FIELDS_INSTRUCTIONS = 'You are a helpful AI Assistant with the main goal to extract information from the text to fill a form. Output must be in JSON, always using the schema defined and for the fields that are not present in the text, return null. You must extract the information according to the schema defined here: '
+
+
+def fields_system_prompt(schema):
+    if compact_schema:
+        return TEMPLATE_INSTRUCTIONS + compile_schema(schema).prompt
+    return FIELDS_INSTRUCTIONS + json.dumps(schema, ensure_ascii=False, separators=(',', ':'))
+
+
+def fields_payload(schema, text, model_name=None):
+    return {
+        'model': model_name or model,
         'messages': [
             {
-                'role': "assistant",
-                'content': f'You are a helpful AI Assistant with the main goal to extract information from the text to fill a form. You must extract the information according to the schema defined here: {json.dumps(schema)}. Output must be in JSON, always using the schema defined and for the fields that are not present in the text, return null.'
+                'role': "system",
+                'content': fields_system_prompt(schema)
             },
             {
                 'role': "user",
                 'content': text
             }
         ],
-        'format': "json",
+        'format': compile_schema(schema).output_schema if structured_output else "json",
         'stream': False,
         'options': {
             'seed': 123,
-            'temperature': 0.01
+            'temperature': 0.01,
+            # A different context size would reload the model and throw the cache away
+            'num_ctx': num_ctx
         }
     }
 
+
+form_schemas = {}
+
+
+def form_schema(form_id):
+    if not forms_dir or not isinstance(form_id, str) or not form_id.isidentifier():
+        return None
+    if form_id not in form_schemas:
+        path = os.path.join(forms_dir, form_id, 'schema.json')
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            form_schemas[form_id] = json.load(f)
+    return form_schemas[form_id]
+
+
+def request_schema(data):
+    return data.get('schema') if data.get('schema') is not None else form_schema(data.get('form'))
+
+
+fast_path_stats = {'requests': 0, 'llm_skipped': 0, 'fields': 0, 'prefilled': 0}
+
+
+def rule_prefill(schema, text):
+    # Fields the rules are sure about, and the part of the schema still left for the LLM
+    fields = compile_schema(schema).fields
+    prefilled = prefill(fields, text) if use_rules and text else {}
+    remaining = {name: field for name, field in fields.items() if name not in prefilled} if prefilled else schema
+
+    fast_path_stats['requests'] += 1
+    fast_path_stats['llm_skipped'] += not remaining
+    fast_path_stats['fields'] += len(fields)
+    fast_path_stats['prefilled'] += len(prefilled)
+    return prefilled, remaining
+
+
+def merge_fields(schema, generated, prefilled):
+    # One key per top-level field, also when the schema is a full JSON schema
+    merged = {**generated, **prefilled}
+    return {name: merged.get(name) for name in compile_schema(schema).fields}
+
+
+repair_stats = {'extractions': 0, 'invalid_outputs': 0, 'repair_calls': 0, 'repaired_fields': 0, 'nulled_fields': 0}
+
+
+async def generate(schema, text, deadline, priority, model_name=None):
+    # One call to the model; the parsed answer (None if it is not JSON) and Ollama's timings
+    response = await call_ollama(fields_payload(schema, text, model_name), priority, deadline)
+    timings = ollama_timings(response)
+    observe_ollama(timings)
+    content = response.get('message', {}).get('content')
+    if not content:
+        raise ValueError('Empty response from model')
     try:
-        response = requests.post(f'{OLLAMA_URL}/api/chat', json=payload)
-        response.raise_for_status()  # Raise an error for bad responses
-        content = response.json().get('message', {}).get('content')
-        if content:
-            # Para testar
-            json_schema = json.loads(content)
-            print(json_schema)
-            return jsonify(content)
+        return json.loads(content), timings
+    except ValueError:
+        return None, timings
+
+
+async def extract(schema, text, deadline, priority=PRIORITY_FIELDS, model_name=None):
+    # One extraction, checked against the schema. Only the fields that come back invalid
+    # (all of them if the answer is not a JSON object) are asked again, on their own, up to
+    # `repair_attempts` times; whatever is still invalid after that is returned as null.
+    # Returns the fields and Ollama's timings of all the calls.
+    answer, timings = await generate(schema, text, deadline, priority, model_name)
+
+    compiled = compile_schema(schema)
+    fields = answer if isinstance(answer, dict) else {}
+    invalid = compiled.validate(fields) if isinstance(answer, dict) else list(compiled.fields)
+    all_timings = [timings]
+    repair_stats['extractions'] += 1
+    repair_stats['invalid_outputs'] += bool(invalid)
+
+    for _ in range(repair_attempts if invalid else 0):
+        repair_stats['repair_calls'] += 1
+        repaired, timings = await generate({name: compiled.fields[name] for name in invalid}, text, deadline, priority, model_name)
+        all_timings.append(timings)
+        if isinstance(repaired, dict):
+            fields.update({name: repaired.get(name) for name in invalid})
+            still_invalid = compiled.validate(fields)
+            repair_stats['repaired_fields'] += len(set(invalid) - set(still_invalid))
+            invalid = still_invalid
+        if not invalid:
+            break
+
+    if not fields and invalid:
+        raise ValueError('Model output is not a JSON object')
+    repair_stats['nulled_fields'] += len(invalid)
+    for name in invalid:
+        fields[name] = None
+    return fields, combine_timings(all_timings, parallel=False)
+
+
+cascade_stats = {'extractions': 0, 'escalated': 0, 'fields': 0, 'escalated_fields': 0}
+
+
+async def cascade_extract(schema, text, deadline, priority=PRIORITY_FIELDS):
+    # Same answer as extract(), but from the small model wherever it is confident; the large
+    # model only gets the doubtful fields, which also stand in for the repair of the small
+    # model's invalid ones
+    small, large = cascade_models[:2]
+    answer, timings = await generate(schema, text, deadline, priority, small)
+
+    compiled = compile_schema(schema)
+    fields = answer if isinstance(answer, dict) else {}
+    invalid = compiled.validate(fields) if isinstance(answer, dict) else list(compiled.fields)
+    confidence = field_confidence(compiled.fields, fields, text, invalid)
+    doubtful = {name: compiled.fields[name] for name, score in confidence.items() if score < cascade_threshold}
 
-    except requests.RequestException as e:
+    cascade_stats['extractions'] += 1
+    cascade_stats['escalated'] += bool(doubtful)
+    cascade_stats['fields'] += len(confidence)
+    cascade_stats['escalated_fields'] += len(doubtful)
+    if not doubtful:
+        return fields, timings
+
+    large_fields, large_timings = await extract(doubtful, text, deadline, priority, large)
+    fields.update({name: large_fields.get(name) for name in doubtful})
+    return fields, combine_timings([timings, large_timings], parallel=False)
+
+
+async def extract_sections(schema, text, deadline, priority=PRIORITY_FIELDS):
+    # Large forms can be split into sections that are extracted in parallel; returns the
+    # merged fields, the combined timings and the number of sections
+    sections = compile_schema(schema, section_size).sections
+    extractor = cascade_extract if len(cascade_models) >= 2 else extract
+    results = await asyncio.gather(*(extractor(section, text, deadline, priority) for section in sections))
+
+    generated = {}
+    for section, (section_fields, _) in zip(sections, results):
+        # A section only answers for its own fields; models sometimes echo the others as null
+        generated.update({name: value for name, value in section_fields.items() if len(sections) == 1 or name in section})
+    return generated, combine_timings([section_timings for _, section_timings in results]), len(sections)
+
+
+@app.route('/fields', methods=['POST'])
+async def fields():
+    data = await request.get_json()
+    schema = request_schema(data)
+    text = data.get('text')
+    if schema is None and data.get('form'):
+        return jsonify({'error': f"Unknown form: {data.get('form')}"}), 404
+    # Fields are only known for an object schema; everything past this point relies on it
+    if not isinstance(schema, dict):
+        return jsonify({'error': 'A schema or a form id is required'}), 400
+
+    prefilled, remaining = rule_prefill(schema, text)
+    headers = {'X-Prefilled-Fields': str(len(prefilled))}
+    if not remaining:
+        return jsonify(json.dumps(merge_fields(schema, {}, prefilled), ensure_ascii=False)), 200, headers
+
+    deadline = request_deadline(fields_deadline_s)
+
+    try:
+        # The whole schema even when the rules filled part of it: asking only for `remaining`
+        # would change the prompt prefix from one text to the next and lose Ollama's KV cache
+        # of it, which costs more than the few extra fields. The rule-based values win at merge.
+        generated, timings, sections = await extract_sections(schema, text, deadline)
+    except NoBackendError:
+        raise
+    except (httpx.TimeoutException, TimeoutError) as e:
+        return jsonify({'error': f'Model timed out: {e}'}), 504
+    except httpx.HTTPError as e:
         return jsonify({'error': str(e)}), 500
+    except ValueError as e:
+        return jsonify({'error': f'Invalid response from model: {e}'}), 502
+
+    # Para testar
+    print(generated)
+    print(json.dumps({'endpoint': '/fields', 'prefilled': len(prefilled), 'sections': sections, **timings}))
+    headers['Server-Timing'] = server_timing(timings)
+
+    content = json.dumps(merge_fields(schema, generated, prefilled), ensure_ascii=False)
+    return jsonify(content), 200, headers
+
+
+@app.route('/fields/stats', methods=['GET'])
+async def fields_stats():
+    requests_seen = fast_path_stats['requests']
+    return jsonify({
+        **fast_path_stats,
+        'llm_skip_rate': fast_path_stats['llm_skipped'] / requests_seen if requests_seen else 0.0,
+        'prefilled_rate': fast_path_stats['prefilled'] / fast_path_stats['fields'] if fast_path_stats['fields'] else 0.0,
+        'repair': repair_stats,
+        'cascade': {
+            **cascade_stats,
+            'escalation_rate': cascade_stats['escalated'] / cascade_stats['extractions'] if cascade_stats['extractions'] else 0.0,
+        },
+    })
+
+
+def extraction_error(e):
+    # Status and message for a failed extraction, as /fields would answer them
+    if isinstance(e, Rejected):
+        return e.status, str(e)
+    if isinstance(e, NoBackendError):
+        return 503, str(e)
+    if isinstance(e, (httpx.TimeoutException, TimeoutError)):
+        return 504, f'Model timed out: {e}'
+    if isinstance(e, httpx.HTTPError):
+        return 500, str(e)
+    return 502, f'Invalid response from model: {e}'
+
+
+async def batch_lines(body):
+    # The lines of a streamed request body, read as they arrive
+    pending = b''
+    async for chunk in body:
+        *lines, pending = (pending + chunk).split(b'\n')
+        for line in lines:
+            if line.strip():
+                yield line
+    if pending.strip():
+        yield pending
+
+
+async def fill_batch_item(schema, line):
+    try:
+        item = json.loads(line)
+    except ValueError:
+        return {'status': 400, 'error': 'Invalid JSON line'}
+    item_id, text = (item.get('id'), item.get('text')) if isinstance(item, dict) else (None, item)
+    result = {'id': item_id} if item_id is not None else {}
+    if not isinstance(text, str):
+        return {**result, 'status': 400, 'error': 'Text is required'}
+
+    prefilled, remaining = rule_prefill(schema, text)
+    generated = {}
+    deadline = time.monotonic() + batch_item_deadline_s
+    while remaining:
+        try:
+            # Always the whole schema, so every text of the batch shares the same prompt
+            # prefix and Ollama only evaluates the new text; the rule-based values still win
+            generated, _, _ = await extract_sections(schema, text, deadline, PRIORITY_BATCH)
+            break
+        except Rejected as e:
+            # Bulk work waits for room in the queue instead of failing
+            if e.status != 429 or time.monotonic() + e.retry_after_s > deadline:
+                return {**result, 'status': e.status, 'error': str(e)}
+            await asyncio.sleep(e.retry_after_s)
+        except (httpx.HTTPError, TimeoutError, ValueError) as e:
+            status, error = extraction_error(e)
+            return {**result, 'status': status, 'error': error}
+    return {**result, 'status': 200, 'fields': merge_fields(schema, generated, prefilled)}
+
+
+# Bulk extraction for one form: the body is NDJSON, a first line {"schema": ...} or
+# {"form": id} (or ?form=id instead) and then one text per line, either a JSON string or
+# {"id": ..., "text": ...}. The answer is NDJSON too, one line per text in input order
+# ({"index", "id", "status", "fields" or "error"}; a failed text does not stop the batch)
+# and a last {"done": true, ...} line. At most BATCH_CONCURRENCY texts are in flight, at
+# the lowest admission priority, and lines are only read from the client as results go
+# out (see streamed_body.py), so a batch has no size limit and the gateway never holds more
+# of it than the texts in flight.
+@app.route('/fields/batch', methods=['POST'])
+async def fields_batch():
+    lines = batch_lines(request.body)
+    header = {'form': request.args['form']} if 'form' in request.args else None
+    if header is None:
+        try:
+            header = json.loads(await anext(lines))
+        except (StopAsyncIteration, ValueError):
+            header = None
+    schema = request_schema(header) if isinstance(header, dict) else None
+    if not isinstance(schema, dict):
+        return jsonify({'error': 'The first line must be {"schema": {...}} or {"form": id}'}), 400
+
+    async def results():
+        start = time.monotonic()
+        window = deque()
+        count = errors = 0
+
+        async def next_result():
+            nonlocal count, errors
+            result = {'index': count, **await window.popleft()}
+            count += 1
+            errors += result['status'] != 200
+            return json.dumps(result, ensure_ascii=False) + '\n'
+
+        try:
+            async for line in lines:
+                window.append(asyncio.create_task(fill_batch_item(schema, line)))
+                if len(window) >= batch_concurrency:
+                    yield await next_result()
+            while window:
+                yield await next_result()
+        finally:
+            # The client went away: do not keep extracting for nobody
+            for task in window:
+                task.cancel()
+
+        summary = {'done': True, 'items': count, 'errors': errors, 'elapsed_s': round(time.monotonic() - start, 3)}
+        print(json.dumps({'endpoint': '/fields/batch', **summary}))
+        yield json.dumps(summary) + '\n'
+
+    response = await make_response(results(), 200, {'Content-Type': 'application/x-ndjson', 'X-Accel-Buffering': 'no'})
+    # A batch takes as long as its texts do; each of them has its own deadline
+    response.timeout = None
+    return response
+
+
+# Dictation in several utterances: POST /sessions with {"schema"} or {"form"} starts a form,
+# then every POST /sessions/<id>/utterances {"text"} only asks the model about the fields
+# still empty plus the ones the utterance names, and merges the answer into the stored form.
+@app.route('/sessions', methods=['POST'])
+async def create_session():
+    data = await request.get_json(silent=True) or {}
+    schema = request_schema(data)
+    if schema is None and data.get('form'):
+        return jsonify({'error': f"Unknown form: {data.get('form')}"}), 404
+    if not isinstance(schema, dict):
+        return jsonify({'error': 'A schema or a form id is required'}), 400
+    session = sessions.create(schema, compile_schema(schema).fields)
+    return jsonify(session.state()), 201
+
+
+@app.route('/sessions', methods=['GET'])
+async def sessions_stats():
+    return jsonify(sessions.stats())
+
+
+@app.route('/sessions/<session_id>', methods=['GET'])
+async def get_session(session_id):
+    session = sessions.get(session_id)
+    if session is None:
+        return jsonify({'error': 'Unknown or expired session'}), 404
+    return jsonify(session.state())
+
+
+@app.route('/sessions/<session_id>', methods=['DELETE'])
+async def delete_session(session_id):
+    if not sessions.delete(session_id):
+        return jsonify({'error': 'Unknown or expired session'}), 404
+    return jsonify({'deleted': session_id})
+
+
+@app.route('/sessions/<session_id>/utterances', methods=['POST'])
+async def session_utterance(session_id):
+    session = sessions.get(session_id)
+    if session is None:
+        return jsonify({'error': 'Unknown or expired session'}), 404
+    data = await request.get_json()
+    text = data.get('text')
+    if not text:
+        return jsonify({'error': 'Text is required'}), 400
+    deadline = request_deadline(fields_deadline_s)
+
+    async with session.lock:
+        targets = session.targets(text)
+        prefilled, remaining = rule_prefill(targets, text) if targets else ({}, {})
+        headers = {'X-Target-Fields': str(len(targets)), 'X-Prefilled-Fields': str(len(prefilled))}
+        generated = {}
+        if remaining:
+            try:
+                generated, timings, _ = await extract_sections(remaining, text, deadline)
+            except (httpx.HTTPError, TimeoutError, ValueError) as e:
+                if isinstance(e, NoBackendError):
+                    raise
+                status, error = extraction_error(e)
+                return jsonify({'error': error}), status
+            headers['Server-Timing'] = server_timing(timings)
+            print(json.dumps({'endpoint': '/sessions/utterances', 'targets': len(targets), 'fields': len(session.fields), **timings}))
+        # Models echo fields they were not asked about; only the targets are merged
+        updated = session.merge({**{name: value for name, value in generated.items() if name in targets}, **prefilled})
+
+    return jsonify({**session.state(), 'updated': updated}), 200, headers
+
+
+def sse(data, event=None):
+    prefix = f'event: {event}\n' if event else ''
+    return f'{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n'
+
+
+# Same extraction as /fields, but as Server-Sent Events: one "field" event per top-level
+# field as soon as the model has finished writing its value, then a "done" event with the
+# whole form (or an "error" event).
+@app.route('/fields/stream', methods=['POST'])
+async def fields_stream():
+    data = await request.get_json()
+    schema = request_schema(data)
+    if schema is None and data.get('form'):
+        return jsonify({'error': f"Unknown form: {data.get('form')}"}), 404
+    # Fields are only known for an object schema; everything past this point relies on it
+    if not isinstance(schema, dict):
+        return jsonify({'error': 'A schema or a form id is required'}), 400
+    prefilled, remaining = rule_prefill(schema, data.get('text'))
+    # The whole schema for the same prompt prefix as /fields; the model's values for the
+    # prefilled fields are dropped below
+    payload = fields_payload(schema, data.get('text'))
+    deadline = request_deadline(fields_deadline_s)
+    # A full queue is still answered with a 429 and not an error event, but the slot itself
+    # is only taken once the stream runs and is held by it: a client that goes away before
+    # or during the stream cannot keep it
+    if remaining:
+        admission.check(PRIORITY_FIELDS)
+
+    async def events():
+        # Rule-based fields are known before the model even starts
+        for key, value in prefilled.items():
+            yield sse({'field': key, 'value': value}, 'field')
+        if not remaining:
+            yield sse(merge_fields(schema, {}, prefilled), 'done')
+            return
+
+        parser = JsonFieldStream()
+        queued = time.monotonic()
+        try:
+            async with admission.slot(PRIORITY_FIELDS, deadline):
+                observe_stage('admission_wait', time.monotonic() - queued)
+                # Checked between messages: a timeout scope must not stay open across a yield
+                async for message in ollama.chat_stream(payload):
+                    if time.monotonic() > deadline:
+                        yield sse({'error': 'Model timed out'}, 'error')
+                        return
+                    for key, value in parser.feed(message.get('message', {}).get('content', '')):
+                        if key not in prefilled:
+                            yield sse({'field': key, 'value': value}, 'field')
+                    if message.get('done'):
+                        timings = ollama_timings(message)
+                        observe_ollama(timings)
+                        print(json.dumps({'endpoint': '/fields/stream', **timings}))
+                        yield sse(timings, 'timings')
+        except (httpx.HTTPError, Rejected) as e:
+            yield sse({'error': str(e)}, 'error')
+            return
+        yield sse(merge_fields(schema, parser.fields, prefilled) if prefilled else parser.fields, 'done')
+
+    response = await make_response(events(), 200, {'Content-Type': 'text/event-stream', 'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Quart's RESPONSE_TIMEOUT (60 s) would cut a slow model off mid-stream; the stream is
+    # bounded by the request's own deadline instead
+    response.timeout = None
+    return response
 
 
 if __name__ == '__main__':
@@ -0,0 +1,115 @@
+import os
+import json
+import time
+import hashlib
+from collections import OrderedDict
+
+
+class ResponseCache:
+    # Content-addressed cache: the key is a hash of everything that determines the answer,
+    # so a changed prompt or form produces a new key instead of a stale hit.
+    # In-memory LRU tier, plus an optional on-disk tier (one JSON file per key) that
+    # survives restarts. Entries expire after `ttl_s` seconds in both tiers.
+    def __init__(self, max_entries=256, ttl_s=7 * 24 * 3600, disk_dir=None, max_disk_entries=4096):
+        self.max_entries = max_entries
+        self.ttl = ttl_s
+        self.disk_dir = disk_dir
+        self.max_disk_entries = max_disk_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @staticmethod
+    def key(*parts):
+        return hashlib.sha256(json.dumps(parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        entry = self.entries.get(key)
+        if entry and entry[0] > now:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        if entry:
+            del self.entries[key]
+
+        entry = self._read_disk(key)
+        if entry and entry['expires_at'] > now:
+            self._remember(key, entry['expires_at'], entry['value'])
+            self.disk_hits += 1
+            return entry['value']
+        if entry:
+            self._remove_disk(key)
+
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        expires_at = time.time() + self.ttl
+        self._remember(key, expires_at, value)
+        if self.disk_dir:
+            path = self._path(key)
+            with open(f'{path}.tmp', 'w', encoding='utf-8') as f:
+                json.dump({'expires_at': expires_at, 'value': value}, f, ensure_ascii=False)
+            os.replace(f'{path}.tmp', path)
+            self._evict_disk()
+
+    def invalidate(self, key=None):
+        keys = [key] if key else list(self.entries) + self._disk_keys()
+        removed = 0
+        for k in set(keys):
+            in_memory = self.entries.pop(k, None) is not None
+            removed += self._remove_disk(k) or in_memory
+        return removed
+
+    def stats(self):
+        return {
+            'entries': len(self.entries),
+            'disk_entries': len(self._disk_keys()),
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+        }
+
+    def _remember(self, key, expires_at, value):
+        self.entries[key] = (expires_at, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def _path(self, key):
+        return os.path.join(self.disk_dir, f'{key}.json')
+
+    def _disk_keys(self):
+        if not self.disk_dir:
+            return []
+        return [f[:-5] for f in os.listdir(self.disk_dir) if f.endswith('.json')]
+
+    def _read_disk(self, key):
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._path(key), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _remove_disk(self, key):
+        if not self.disk_dir:
+            return False
+        try:
+            os.remove(self._path(key))
+            return True
+        except OSError:
+            return False
+
+    def _evict_disk(self):
+        files = [os.path.join(self.disk_dir, f'{key}.json') for key in self._disk_keys()]
+        if len(files) <= self.max_disk_entries:
+            return
+        files.sort(key=os.path.getmtime)
+        for path in files[:len(files) - self.max_disk_entries]:
+            os.remove(path)
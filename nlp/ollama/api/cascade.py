@@ -0,0 +1,65 @@
+import re
+
+from rules import dates, normalize, stems
+
+# Confidence of each field of a small model's answer, for the small-to-large cascade: the
+# fields under the threshold are asked again to the large model. Without token
+# probabilities from Ollama the signals are what can be checked against the text:
+#   - a value that does not fit the schema is never trusted
+#   - a value should be grounded: its words, numbers or date appear in the text
+#   - a null is trusted when nothing in the text names the field, doubted when it does
+# Tune the threshold against the benchmark with nlp/tune_cascade.py.
+
+WORD = re.compile(r'[a-z]{2,}|\d+')
+ISO_DATE = re.compile(r'^(\d{4})-(\d{2})-(\d{2})$')
+# Booleans cannot be grounded by their value, only by a mention of the field
+BOOLEAN_MENTIONED = 0.8
+BOOLEAN_NOT_MENTIONED = 0.5
+NULL_MENTIONED = 0.4
+NULL_NOT_MENTIONED = 0.9
+# A value with nothing to look for in the text (a single letter, an empty list)
+NO_SIGNAL = 0.5
+
+
+def _tokens(text):
+    return {word[:4] for word in WORD.findall(normalize(text))}
+
+
+def grounding(value, text, tokens):
+    # Share of the value found in the text, from 0 to 1; None when the value says nothing
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        number = f'{value:g}'
+        return 1.0 if re.search(rf'(?<![\d.,]){re.escape(number)}(?![\d]|[.,]\d)', text.replace(',', '.')) else 0.0
+    if isinstance(value, str):
+        match = ISO_DATE.match(value)
+        if match:
+            if value in {iso for _, iso in dates(normalize(text))}:
+                return 1.0
+            return 0.5 if match.group(1) in text else 0.0
+        words = _tokens(value)
+        return sum(word in tokens for word in words) / len(words) if words else None
+    parts = value.values() if isinstance(value, dict) else value if isinstance(value, list) else []
+    scores = [score for score in (grounding(part, text, tokens) for part in parts) if score is not None]
+    return sum(scores) / len(scores) if scores else None
+
+
+def field_confidence(fields, answer, text, invalid=()):
+    # {field: confidence} for every top-level field of the (unwrapped) schema
+    normalized = normalize(text)
+    tokens = _tokens(text)
+    confidence = {}
+    for name in fields:
+        value = answer.get(name)
+        is_mentioned = any(stem in normalized for stem in stems(name))
+        if name in invalid:
+            confidence[name] = 0.0
+        elif value is None:
+            confidence[name] = NULL_MENTIONED if is_mentioned else NULL_NOT_MENTIONED
+        elif isinstance(value, bool):
+            confidence[name] = BOOLEAN_MENTIONED if is_mentioned else BOOLEAN_NOT_MENTIONED
+        else:
+            score = grounding(value, text, tokens)
+            confidence[name] = score if score is not None else NO_SIGNAL
+    return confidence
@@ -0,0 +1,75 @@
+import json
+
+
+class JsonFieldStream:
+    # Incremental parser for the top-level object the model is generating. Tokens are fed
+    # as they arrive and every top-level field is returned as soon as its value is complete:
+    # strings, objects and arrays when they close, numbers/booleans/null at the next , or }.
+    def __init__(self):
+        self.text = ''
+        self.pos = 0
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.expect = 'key'
+        self.key = None
+        self.key_start = None
+        self.value_start = None
+        self.fields = {}
+
+    def feed(self, chunk):
+        self.text += chunk
+        completed = []
+        while self.pos < len(self.text):
+            char = self.text[self.pos]
+            if self.in_string:
+                self._string_char(char, completed)
+            elif char in '{[':
+                if self.depth == 1 and self.expect == 'value':
+                    self.value_start = self.pos
+                self.depth += 1
+            elif char in '}]':
+                self.depth -= 1
+                if self.depth == 1 and self.value_start is not None:
+                    self._emit(self.text[self.value_start:self.pos + 1], completed)
+                elif self.depth == 0 and self.value_start is not None:
+                    self._emit(self.text[self.value_start:self.pos], completed)
+            elif char == '"':
+                self.in_string = True
+                if self.depth == 1 and self.expect == 'key':
+                    self.key_start = self.pos
+                elif self.depth == 1 and self.expect == 'value':
+                    self.value_start = self.pos
+            elif self.depth == 1 and char == ':':
+                self.expect = 'value'
+            elif self.depth == 1 and char == ',':
+                if self.value_start is not None:
+                    self._emit(self.text[self.value_start:self.pos], completed)
+                self.expect = 'key'
+            elif self.depth == 1 and self.expect == 'value' and self.value_start is None and not char.isspace():
+                self.value_start = self.pos
+            self.pos += 1
+        return completed
+
+    def _string_char(self, char, completed):
+        if self.escape:
+            self.escape = False
+        elif char == '\\':
+            self.escape = True
+        elif char == '"':
+            self.in_string = False
+            if self.depth == 1 and self.key_start is not None:
+                self.key = json.loads(self.text[self.key_start:self.pos + 1])
+                self.key_start = None
+            elif self.depth == 1 and self.value_start is not None:
+                self._emit(self.text[self.value_start:self.pos + 1], completed)
+
+    def _emit(self, raw, completed):
+        self.value_start = None
+        self.expect = 'after'
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            return
+        self.fields[self.key] = value
+        completed.append((self.key, value))
@@ -0,0 +1,72 @@
+# Concurrent load test for the API.
+#
+#   python loadtest.py [--url http://localhost:3000/fields] [--concurrency 1,8,32] [--requests 64]
+#
+# Sends the dados schema and texto_1 to /fields at each concurrency level and prints the
+# throughput and latency percentiles. Run it against the old and new server (pointed at
+# stub_ollama.py for repeatable numbers) to compare.
+import os
+import sys
+import json
+import time
+import asyncio
+import httpx
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'dados')
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+async def run_level(url, body, concurrency, total):
+    latencies, errors = [], 0
+    queue = asyncio.Queue()
+    for _ in range(total):
+        queue.put_nowait(None)
+
+    async def worker(client):
+        nonlocal errors
+        while not queue.empty():
+            queue.get_nowait()
+            start = time.perf_counter()
+            try:
+                response = await client.post(url, json=body)
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+            except httpx.HTTPError:
+                errors += 1
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(timeout=None, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    if latencies:
+        print(f"concurrency={concurrency:<4} ok={len(latencies):<5} errors={errors:<4} "
+              f"throughput={len(latencies) / elapsed:7.2f} req/s  "
+              f"p50={percentile(latencies, 50):6.2f}s p95={percentile(latencies, 95):6.2f}s p99={percentile(latencies, 99):6.2f}s")
+    else:
+        print(f"concurrency={concurrency:<4} all {errors} requests failed")
+
+
+async def main(url, levels, total):
+    with open(os.path.join(DATA_DIR, 'schema.json')) as f:
+        schema = json.load(f)
+    with open(os.path.join(DATA_DIR, 'texto_1.txt')) as f:
+        text = f.read()
+
+    for concurrency in levels:
+        await run_level(url, {'schema': schema, 'text': text}, concurrency, max(total, concurrency))
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    option = lambda name, default: args[args.index(name) + 1] if name in args else default
+    asyncio.run(main(
+        option('--url', 'http://localhost:3000/fields'),
+        [int(c) for c in option('--concurrency', '1,8,32').split(',')],
+        int(option('--requests', 64)),
+    ))
@@ -0,0 +1,233 @@
+import os
+import json
+import random
+import asyncio
+import httpx
+
+# One or more Ollama nodes (comma separated); calls are balanced across the healthy ones
+OLLAMA_URLS = [url.strip() for url in os.getenv('OLLAMA_URLS', os.getenv('OLLAMA_URL', 'http://ollama:11434')).split(',') if url.strip()]
+# How long Ollama keeps the model (and the KV cache of the last prompt) loaded after a call
+OLLAMA_KEEP_ALIVE = os.getenv('OLLAMA_KEEP_ALIVE', '30m')
+
+
+def ollama_timings(response):
+    # Ollama reports durations in nanoseconds on the final message of a chat
+    ms = lambda key: round(response.get(key, 0) / 1e6, 1)
+    timings = {
+        'load_ms': ms('load_duration'),
+        'prompt_eval_ms': ms('prompt_eval_duration'),
+        'eval_ms': ms('eval_duration'),
+        'total_ms': ms('total_duration'),
+        'prompt_tokens': response.get('prompt_eval_count', 0),
+        'output_tokens': response.get('eval_count', 0),
+    }
+    timings['tokens_per_s'] = round(timings['output_tokens'] / (timings['eval_ms'] / 1000), 1) if timings['eval_ms'] else 0.0
+    return timings
+
+
+def combine_timings(all_timings, parallel=True):
+    # Requests that ran in parallel: the slowest one sets the durations and the speeds add
+    # up; one after the other: the durations add up. Tokens always add up.
+    duration = max if parallel else sum
+    combined = {key: round(duration(t[key] for t in all_timings), 1) for key in ('load_ms', 'prompt_eval_ms', 'eval_ms', 'total_ms')}
+    combined['prompt_tokens'] = sum(t['prompt_tokens'] for t in all_timings)
+    combined['output_tokens'] = sum(t['output_tokens'] for t in all_timings)
+    if parallel:
+        combined['tokens_per_s'] = round(sum(t['tokens_per_s'] for t in all_timings), 1)
+    else:
+        combined['tokens_per_s'] = round(combined['output_tokens'] / (combined['eval_ms'] / 1000), 1) if combined['eval_ms'] else 0.0
+    return combined
+
+
+def server_timing(timings):
+    return ', '.join(f"{name};dur={timings[f'{name}_ms']}" for name in ('load', 'prompt_eval', 'eval', 'total'))
+
+
+class NoBackendError(httpx.TransportError):
+    # Every node that could take the call is ejected or does not have the model
+    pass
+
+
+# The request never reached Ollama, so it can safely go to another node
+CONNECT_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout)
+
+
+class OllamaBackend:
+    def __init__(self, url):
+        self.url = url
+        self.client = None
+        # Calls sent to this node and not answered yet, and all the calls ever sent to it
+        self.outstanding = 0
+        self.calls = 0
+        self.healthy = True
+        self.failures = 0
+        # Models installed (from /api/tags, None until the first check) and in memory
+        self.models = None
+        self.loaded = set()
+
+    def serves(self, model):
+        return self.models is None or model in self.models
+
+    def stats(self):
+        return {
+            'url': self.url,
+            'healthy': self.healthy,
+            'outstanding': self.outstanding,
+            'calls': self.calls,
+            'failures': self.failures,
+            'models': sorted(self.models) if self.models is not None else None,
+            'loaded': sorted(self.loaded),
+        }
+
+
+class OllamaClient:
+    # Pooled keep-alive connections to every Ollama node, instead of a new TCP connection
+    # for every request. Each call goes to the healthy node with the fewest calls in flight,
+    # preferring nodes that already have the model in memory. A node that fails
+    # `eject_after` calls in a row, or a health check (/api/tags every `health_interval`
+    # seconds), is taken out until a health check passes again. Must be started from inside
+    # the event loop.
+    def __init__(self, base_urls=OLLAMA_URLS):
+        self.backends = [OllamaBackend(url) for url in base_urls]
+        self.timeout = httpx.Timeout(
+            float(os.getenv('OLLAMA_READ_TIMEOUT', 300)),
+            connect=float(os.getenv('OLLAMA_CONNECT_TIMEOUT', 5)),
+        )
+        self.limits = httpx.Limits(
+            max_connections=int(os.getenv('OLLAMA_MAX_CONNECTIONS', 64)),
+            max_keepalive_connections=int(os.getenv('OLLAMA_MAX_KEEPALIVE', 16)),
+            keepalive_expiry=float(os.getenv('OLLAMA_KEEPALIVE_EXPIRY', 60)),
+        )
+        self.health_interval = float(os.getenv('OLLAMA_HEALTH_INTERVAL_S', 10))
+        self.health_timeout = float(os.getenv('OLLAMA_HEALTH_TIMEOUT_S', 2))
+        self.eject_after = int(os.getenv('OLLAMA_EJECT_AFTER', 2))
+        # A node with the model loaded is preferred unless it has this many more calls in
+        # flight than the least busy node
+        self.affinity_slack = int(os.getenv('OLLAMA_AFFINITY_SLACK', 2))
+        self.health_task = None
+
+    @property
+    def outstanding(self):
+        return sum(backend.outstanding for backend in self.backends)
+
+    async def start(self):
+        for backend in self.backends:
+            backend.client = httpx.AsyncClient(base_url=backend.url, timeout=self.timeout, limits=self.limits)
+        await self.check_health()
+        self.health_task = asyncio.create_task(self._health_loop())
+
+    async def close(self):
+        if self.health_task is not None:
+            self.health_task.cancel()
+        for backend in self.backends:
+            if backend.client is not None:
+                await backend.client.aclose()
+
+    def stats(self):
+        return [backend.stats() for backend in self.backends]
+
+    async def check_health(self):
+        await asyncio.gather(*(self._check(backend) for backend in self.backends))
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            await self.check_health()
+
+    async def _check(self, backend):
+        try:
+            response = await backend.client.get('/api/tags', timeout=self.health_timeout)
+            response.raise_for_status()
+            backend.models = {model['name'] for model in response.json().get('models', [])}
+            # /api/ps (models in memory) only refines the affinity, it is not a health signal
+            response = await backend.client.get('/api/ps', timeout=self.health_timeout)
+            if response.is_success:
+                backend.loaded = {model['name'] for model in response.json().get('models', [])}
+        except (httpx.HTTPError, ValueError, KeyError) as e:
+            if backend.healthy:
+                print(json.dumps({'event': 'ollama_backend_ejected', 'url': backend.url, 'reason': f'health check: {e!r}'}))
+            backend.healthy = False
+            return
+        if not backend.healthy:
+            print(json.dumps({'event': 'ollama_backend_restored', 'url': backend.url}))
+        backend.healthy = True
+        backend.failures = 0
+
+    def _candidates(self, model, exclude=()):
+        return [backend for backend in self.backends if backend.healthy and backend.serves(model) and backend not in exclude]
+
+    def pick(self, model, exclude=()):
+        candidates = self._candidates(model, exclude)
+        if not candidates:
+            raise NoBackendError(f'No healthy Ollama backend with model {model}')
+        least = min(backend.outstanding for backend in candidates)
+        warm = [backend for backend in candidates if model in backend.loaded and backend.outstanding <= least + self.affinity_slack]
+        pool = warm or candidates
+        fewest = min(backend.outstanding for backend in pool)
+        return random.choice([backend for backend in pool if backend.outstanding == fewest])
+
+    def _failed(self, backend, error):
+        backend.failures += 1
+        if backend.healthy and backend.failures >= self.eject_after:
+            backend.healthy = False
+            print(json.dumps({'event': 'ollama_backend_ejected', 'url': backend.url, 'reason': repr(error)}))
+
+    def _succeeded(self, backend, model):
+        backend.failures = 0
+        backend.loaded.add(model)
+
+    async def chat(self, payload):
+        model = payload.get('model')
+        tried = []
+        while True:
+            backend = self.pick(model, tried)
+            backend.outstanding += 1
+            backend.calls += 1
+            try:
+                response = await backend.client.post('/api/chat', json={'keep_alive': OLLAMA_KEEP_ALIVE, **payload})
+            except CONNECT_ERRORS as e:
+                self._failed(backend, e)
+                tried.append(backend)
+                if not self._candidates(model, tried):
+                    raise
+                continue
+            except httpx.TransportError as e:
+                self._failed(backend, e)
+                raise
+            finally:
+                backend.outstanding -= 1
+            if response.status_code >= 500:
+                self._failed(backend, response.status_code)
+            response.raise_for_status()
+            self._succeeded(backend, model)
+            return response.json()
+
+    async def chat_stream(self, payload):
+        # Yields the NDJSON messages of a streamed chat, the last one has done=True
+        model = payload.get('model')
+        tried = []
+        while True:
+            backend = self.pick(model, tried)
+            backend.outstanding += 1
+            backend.calls += 1
+            try:
+                async with backend.client.stream('POST', '/api/chat', json={'keep_alive': OLLAMA_KEEP_ALIVE, **payload, 'stream': True}) as response:
+                    if response.status_code >= 500:
+                        self._failed(backend, response.status_code)
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        if line.strip():
+                            yield json.loads(line)
+                self._succeeded(backend, model)
+                return
+            except CONNECT_ERRORS as e:
+                # Raised before anything was yielded
+                self._failed(backend, e)
+                tried.append(backend)
+                if not self._candidates(model, tried):
+                    raise
+            except httpx.TransportError as e:
+                self._failed(backend, e)
+                raise
+            finally:
+                backend.outstanding -= 1
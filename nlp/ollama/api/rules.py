@@ -0,0 +1,147 @@
+import re
+import unicodedata
+
+# Deterministic pre-extraction for the fields a regex can answer with certainty (e-mails,
+# phone numbers, ages, dates, measurements, numbers next to their keyword, yes/no
+# mentions). A rule only fills a field when it finds exactly one candidate; everything
+# else is left to the LLM.
+
+MONTHS = {
+    'janeiro': 1, 'fevereiro': 2, 'marco': 3, 'abril': 4, 'maio': 5, 'junho': 6,
+    'julho': 7, 'agosto': 8, 'setembro': 9, 'outubro': 10, 'novembro': 11, 'dezembro': 12,
+}
+NEGATIONS = {'nao', 'sem', 'nenhum', 'nenhuma', 'nunca', 'ausencia', 'no', 'not', 'without'}
+# Name parts that say nothing about where the value is in the text
+GENERIC_WORDS = {'de', 'do', 'da', 'has', 'tem', 'is', 'numero', 'data', 'nome', 'tipo', 'atual', 'atuais', 'paciente', 'pessoa', 'crianca'}
+
+NUMBER = r'(\d+(?:[.,]\d+)?)'
+EMAIL = re.compile(r'[\w.+-]+@[\w-]+\.[\w.-]+\w')
+PHONE = re.compile(r'\(\d{2}\)\s*\d{4,5}-\d{4}|(?<!\d)[29]\d{8}(?!\d)')
+AGE = re.compile(r'(?<![\d.,])(\d{1,3})(?:\s*anos\b|-year-old|\s*years old)')
+PAIN = re.compile(r'\b(?:dor|pain)\b[^.]{0,60}?\b(\d{1,2})\s*(?:em|on|/|de)\s*(?:uma\s+|a\s+)?(?:escala|scale|10)')
+SIZE = re.compile(NUMBER + r'\s*(mm|cm)\b')
+DATE_WORDS = re.compile(r'\b(\d{1,2})\s+de\s+([a-z]+)\s+de\s+(\d{4})')
+DATE_NUMERIC = re.compile(r'\b(\d{1,2})/(\d{1,2})/(\d{4})\b')
+
+MISSING = object()
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', text)
+    return ''.join(c for c in text if not unicodedata.combining(c)).lower()
+
+
+def to_number(value):
+    number = float(value.replace(',', '.'))
+    return int(number) if number.is_integer() else number
+
+
+def unique(values):
+    values = list(dict.fromkeys(values))
+    return values[0] if len(values) == 1 else MISSING
+
+
+def stems(name):
+    return [word[:4] for word in normalize(name).split('_') if word not in GENERIC_WORDS and len(word) >= 3]
+
+
+def dates(text):
+    # (position, ISO date) for every full date written in the text
+    found = []
+    for match in DATE_WORDS.finditer(text):
+        if match.group(2) in MONTHS:
+            found.append((match.start(), f"{match.group(3)}-{MONTHS[match.group(2)]:02d}-{int(match.group(1)):02d}"))
+    for match in DATE_NUMERIC.finditer(text):
+        found.append((match.start(), f"{match.group(3)}-{int(match.group(2)):02d}-{int(match.group(1)):02d}"))
+    return found
+
+
+def mentioned(text, keywords):
+    # True/False when a clause mentions every keyword, with or without a negation shortly
+    # before it; MISSING when no clause does, or when clauses disagree
+    answers = []
+    for clause in re.split(r'[.;,]', text):
+        words = clause.split()
+        positions = [next((i for i, w in enumerate(words) if w.startswith(k)), None) for k in keywords]
+        if None in positions:
+            continue
+        first = min(positions)
+        answers.append(not NEGATIONS.intersection(words[max(0, first - 5):first]))
+    return unique(answers)
+
+
+def keyword_number(text, keywords):
+    # A number shortly after the field's keywords, inside the same sentence
+    found = []
+    for sentence in text.split('. '):
+        words = sentence.split()
+        hits = [next((i for i, w in enumerate(words) if w.startswith(k)), None) for k in keywords]
+        if not keywords or None in hits:
+            continue
+        after = ' '.join(words[max(hits):max(hits) + 8])
+        match = re.search(r'(?<![\d/])' + NUMBER + r'(?![\d/])', after)
+        if match:
+            found.append(to_number(match.group(1).rstrip('.,')))
+    return unique(found)
+
+
+def extract_field(name, field, text, schema_kinds):
+    field_type = field.get('type')
+    description = normalize(field.get('description', ''))
+    key = normalize(name)
+
+    if field_type == 'string' and field.get('format') == 'date':
+        keywords = stems(name)
+        return unique(iso for position, iso in dates(text) if any(k in text[max(0, position - 40):position] for k in keywords))
+
+    if field_type == 'string' and ('email' in key or 'e-mail' in description):
+        return unique(EMAIL.findall(text)) if schema_kinds.count('email') == 1 else MISSING
+
+    if field_type == 'string' and ('telefone' in key or 'telemovel' in key or 'telefone' in description):
+        return unique(PHONE.findall(text)) if schema_kinds.count('phone') == 1 else MISSING
+
+    if field_type == 'number' and key.startswith(('idade', 'age')):
+        return unique(int(age) for age in AGE.findall(text)) if schema_kinds.count('age') == 1 else MISSING
+
+    if field_type == 'number' and ('dor' in key.split('_') or 'pain' in key):
+        return unique(int(level) for level in PAIN.findall(text))
+
+    if field_type == 'number':
+        return keyword_number(text, stems(name))
+
+    if field_type == 'boolean':
+        keywords = stems(name)
+        return mentioned(text, keywords) if keywords else MISSING
+
+    if field_type == 'object' and set(field.get('properties', {})) == {'valor', 'unidade'}:
+        size = unique((to_number(value), unit) for value, unit in SIZE.findall(text))
+        return MISSING if size is MISSING else {'valor': size[0], 'unidade': size[1]}
+
+    return MISSING
+
+
+def kind(name, field):
+    key, description = normalize(name), normalize(field.get('description', ''))
+    if field.get('type') == 'string' and ('email' in key or 'e-mail' in description):
+        return 'email'
+    if field.get('type') == 'string' and ('telefone' in key or 'telemovel' in key or 'telefone' in description):
+        return 'phone'
+    if field.get('type') == 'number' and key.startswith(('idade', 'age')):
+        return 'age'
+    return None
+
+
+def prefill(schema, text):
+    # Returns {field: value} for the top-level fields the rules are sure about
+    normalized = normalize(text)
+    schema_kinds = [kind(name, field) for name, field in schema.items() if isinstance(field, dict)]
+    filled = {}
+    for name, field in schema.items():
+        if not isinstance(field, dict):
+            continue
+        # Phone numbers and e-mails keep their original spelling
+        source = text if kind(name, field) in ('email', 'phone') else normalized
+        value = extract_field(name, field, source, schema_kinds)
+        if value is not MISSING:
+            filled[name] = value
+    return filled
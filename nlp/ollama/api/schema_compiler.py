@@ -0,0 +1,196 @@
+import re
+import json
+import unicodedata
+from functools import lru_cache
+from collections import Counter, namedtuple
+
+# Turns a form schema into what the model actually needs to see, once per form:
+#   template - a JSON template of the answer where every value is a short type hint
+#              ("str", "num", "bool", "date", ["str"], nested objects), followed by the
+#              description only when it says more than the field name does
+#   sections - the top-level fields split in groups, so very large forms can be extracted
+#              with several smaller requests in parallel
+#   output_schema - the JSON schema the answer must follow, for Ollama's structured output
+#              ("format"): every field present and nullable, no other keys
+#   validate - checks a parsed answer, returns the top-level fields whose value does not fit
+# The field names are kept as they are rather than shortened: the answer is validated,
+# streamed field by field, prefilled by the rules and merged under those names, and a
+# meaningful name is often all the model has to go on once the description is dropped.
+CompiledSchema = namedtuple('CompiledSchema', ['fields', 'template', 'prompt', 'sections', 'output_schema', 'validate'])
+
+# Instructions that go with the template in the prompt
+TEMPLATE_INSTRUCTIONS = 'You are a helpful AI Assistant with the main goal to extract information from the text to fill a form. Answer with the JSON template below filled in: same keys and nesting, every value replaced by the information from the text. Each template value gives the expected type (str, num, int, bool, date YYYY-MM-DD, [...] for lists) and sometimes a description. For the fields that are not present in the text, return null. Template: '
+
+TYPE_HINTS = {'string': 'str', 'number': 'num', 'integer': 'int', 'boolean': 'bool'}
+STOPWORDS = {'a', 'o', 'as', 'os', 'de', 'do', 'da', 'dos', 'das', 'em', 'e', 'se', 'ha', 'que', 'para', 'com', 'uma', 'um',
+             'the', 'of', 'a', 'an', 'if', 'is', 'there', 'to', 'for', 'in', "'s", 's'}
+
+
+def _words(text):
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(c for c in text if not unicodedata.combining(c)).lower()
+    return [w for w in re.findall(r"[a-z0-9']+", text) if w not in STOPWORDS]
+
+
+def _stem(word):
+    return word[:5]
+
+
+def unwrap(schema):
+    # Accepts both the plain {field: {...}} form used in nlp/*/schema.json and a full JSON
+    # schema ({"type": "object", "properties": {...}})
+    if isinstance(schema, dict) and schema.get('type') == 'object' and isinstance(schema.get('properties'), dict):
+        return schema['properties']
+    return schema
+
+
+def _hint(name, field, common):
+    # Descriptions like "Idade do paciente" only repeat the name plus words most fields
+    # share; they are dropped, keeping parenthesised options such as "(I, II, III, IV)"
+    description = field.get('description', '')
+    options = ' '.join(re.findall(r'\([^)]*\)', description))
+    known = {_stem(w) for w in _words(name.replace('_', ' '))} | common
+    new_words = [w for w in _words(re.sub(r'\([^)]*\)', ' ', description)) if _stem(w) not in known]
+    return description if len(new_words) >= 2 else options
+
+
+def _template(fields, common):
+    template = {}
+    for name, field in fields.items():
+        if not isinstance(field, dict):
+            continue
+        field_type = field.get('type')
+        if field_type == 'object' and isinstance(field.get('properties'), dict):
+            template[name] = _template(field['properties'], common)
+            continue
+        if field_type == 'array':
+            items = field.get('items', {})
+            if items.get('type') == 'object' and isinstance(items.get('properties'), dict):
+                template[name] = [_template(items['properties'], common)]
+            else:
+                hint = _hint(name, field, common)
+                template[name] = [TYPE_HINTS.get(items.get('type'), 'str') + (f' {hint}' if hint else '')]
+            continue
+        hint_type = 'date YYYY-MM-DD' if field.get('format') == 'date' else TYPE_HINTS.get(field_type, 'str')
+        hint = _hint(name, field, common)
+        template[name] = hint_type + (f' {hint}' if hint else '')
+    return template
+
+
+def _common_words(fields):
+    # Words that appear in the description of more than half of the fields
+    counts = Counter()
+    total = 0
+    stack = list(fields.values())
+    while stack:
+        field = stack.pop()
+        if not isinstance(field, dict):
+            continue
+        if isinstance(field.get('properties'), dict):
+            stack.extend(field['properties'].values())
+        if field.get('description'):
+            total += 1
+            counts.update({_stem(w) for w in _words(field['description'])})
+    return {stem for stem, count in counts.items() if total >= 4 and count > total / 2}
+
+
+def _sections(fields, section_size):
+    names = list(fields)
+    if not section_size or len(names) <= section_size:
+        return [fields]
+    count = -(-len(names) // section_size)
+    size = -(-len(names) // count)
+    return [{name: fields[name] for name in names[i:i + size]} for i in range(0, len(names), size)]
+
+
+def _field_schema(field, nullable=True):
+    # Only what constrains the output; descriptions are already in the prompt
+    if not isinstance(field, dict):
+        return {}
+    result = {key: value for key, value in field.items() if key in ('type', 'format', 'enum')}
+    if field.get('type') == 'object' and isinstance(field.get('properties'), dict):
+        result.update(_output_schema(field['properties']))
+    if field.get('type') == 'array' and isinstance(field.get('items'), dict):
+        result['items'] = _field_schema(field['items'], nullable=False)
+    if nullable and isinstance(result.get('type'), str):
+        result['type'] = [result['type'], 'null']
+    if nullable and isinstance(result.get('enum'), list) and None not in result['enum']:
+        result['enum'] = result['enum'] + [None]
+    return result
+
+
+def _output_schema(fields):
+    return {
+        'type': 'object',
+        'properties': {name: _field_schema(field) for name, field in fields.items()},
+        'required': list(fields),
+        'additionalProperties': False,
+    }
+
+
+DATE = re.compile(r'\d{4}-\d{2}-\d{2}$')
+TYPE_CHECKS = {
+    'string': lambda value: isinstance(value, str),
+    'number': lambda value: isinstance(value, (int, float)) and not isinstance(value, bool),
+    'integer': lambda value: isinstance(value, int) and not isinstance(value, bool),
+    'boolean': lambda value: isinstance(value, bool),
+}
+
+
+def _checker(field):
+    # Builds the check for one field once, so validating an answer is only function calls;
+    # null always passes (the field was not in the text)
+    if not isinstance(field, dict):
+        return lambda value: True
+    if field.get('type') == 'object' and isinstance(field.get('properties'), dict):
+        checks = {name: _checker(sub) for name, sub in field['properties'].items()}
+        return lambda value: value is None or (isinstance(value, dict) and all(check(value.get(name)) for name, check in checks.items()))
+    if field.get('type') == 'array':
+        item = _checker(field.get('items'))
+        return lambda value: value is None or (isinstance(value, list) and all(item(v) for v in value))
+
+    of_type = TYPE_CHECKS.get(field.get('type'), lambda value: True)
+    if field.get('format') == 'date':
+        of_type = lambda value: isinstance(value, str) and DATE.match(value) is not None
+    enum = field.get('enum')
+    return lambda value: value is None or (of_type(value) and (enum is None or value in enum))
+
+
+def _validator(fields):
+    checks = {name: _checker(field) for name, field in fields.items()}
+    return lambda answer: [name for name, check in checks.items() if not check(answer.get(name))]
+
+
+@lru_cache(maxsize=256)
+def _compile(schema_json, section_size):
+    fields = unwrap(json.loads(schema_json))
+    template = _template(fields, _common_words(fields))
+    prompt = json.dumps(template, ensure_ascii=False, separators=(',', ':'))
+    return CompiledSchema(fields, template, prompt, _sections(fields, section_size), _output_schema(fields), _validator(fields))
+
+
+def compile_schema(schema, section_size=0):
+    # Cached per distinct schema; the result is shared, do not modify it
+    return _compile(json.dumps(schema, ensure_ascii=False, separators=(',', ':')), section_size)
+
+
+def compact_json_schema(schema):
+    # Same idea for APIs that need a real JSON schema (OpenAI function calling): keeps the
+    # structure and types, drops the descriptions that only repeat the field name
+    fields = unwrap(schema)
+    common = _common_words(fields)
+
+    def compact(name, field):
+        if not isinstance(field, dict):
+            return field
+        result = {key: value for key, value in field.items() if key != 'description'}
+        hint = _hint(name, field, common)
+        if hint:
+            result['description'] = field['description']
+        if isinstance(field.get('properties'), dict):
+            result['properties'] = {key: compact(key, value) for key, value in field['properties'].items()}
+        if isinstance(field.get('items'), dict):
+            result['items'] = compact(name, field['items'])
+        return result
+
+    return {name: compact(name, field) for name, field in fields.items()}
@@ -0,0 +1,83 @@
+import time
+import uuid
+import asyncio
+from collections import OrderedDict
+
+from rules import normalize, stems
+
+
+class Session:
+    def __init__(self, schema, fields):
+        self.id = uuid.uuid4().hex
+        self.schema = schema
+        # Unwrapped top-level fields and the form filled so far
+        self.fields = fields
+        self.values = {name: None for name in fields}
+        self.utterances = 0
+        self.last_used = time.monotonic()
+        # One utterance at a time, so two merges never interleave
+        self.lock = asyncio.Lock()
+
+    def targets(self, text):
+        # The fields worth asking about for a new utterance: the ones still empty and the
+        # filled ones the utterance names (a correction, "afinal a idade é 40"); everything
+        # else is left out of the prompt, so it shrinks as the form fills up
+        normalized = normalize(text)
+        return {
+            name: field for name, field in self.fields.items()
+            if self.values[name] is None or any(stem in normalized for stem in stems(name))
+        }
+
+    def merge(self, extracted):
+        # A value the utterance did not give (null) never erases what an earlier one did
+        updated = [name for name, value in extracted.items() if name in self.values and value is not None and value != self.values[name]]
+        for name in updated:
+            self.values[name] = extracted[name]
+        self.utterances += 1
+        return updated
+
+    def state(self):
+        return {'session': self.id, 'fields': self.values, 'utterances': self.utterances}
+
+
+class SessionStore:
+    # Dictation sessions kept in memory: at most `max_sessions`, least recently used first
+    # out, and a session idle for `idle_ttl_s` seconds is dropped.
+    def __init__(self, max_sessions=1000, idle_ttl_s=1800):
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl_s
+        self.sessions = OrderedDict()
+        self.evicted = 0
+
+    def create(self, schema, fields):
+        self._expire()
+        session = Session(schema, fields)
+        self.sessions[session.id] = session
+        while len(self.sessions) > self.max_sessions:
+            self.sessions.popitem(last=False)
+            self.evicted += 1
+        return session
+
+    def get(self, session_id):
+        self._expire()
+        session = self.sessions.get(session_id)
+        if session:
+            session.last_used = time.monotonic()
+            self.sessions.move_to_end(session_id)
+        return session
+
+    def delete(self, session_id):
+        return self.sessions.pop(session_id, None) is not None
+
+    def stats(self):
+        return {'sessions': len(self.sessions), 'max_sessions': self.max_sessions, 'idle_ttl_s': self.idle_ttl, 'evicted': self.evicted}
+
+    def _expire(self):
+        # Oldest first, so the scan stops at the first session still in use
+        deadline = time.monotonic() - self.idle_ttl
+        while self.sessions:
+            session = next(iter(self.sessions.values()))
+            if session.last_used > deadline:
+                break
+            self.sessions.popitem(last=False)
+            self.evicted += 1
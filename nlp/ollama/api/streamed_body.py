@@ -0,0 +1,55 @@
+import asyncio
+
+from quart.asgi import ASGIHTTPConnection
+from quart.wrappers.request import Body
+
+
+class StreamedBody(Body):
+    # A request body that is only read from the client as fast as the view consumes it:
+    # `drained` is set once the view has taken everything received so far
+    def __init__(self):
+        super().__init__(None, None)
+        self.drained = asyncio.Event()
+        self.drained.set()
+
+    async def __anext__(self):
+        data = await super().__anext__()
+        self.drained.set()
+        return data
+
+    def append(self, data):
+        super().append(data)
+        if data:
+            self.drained.clear()
+
+
+class StreamedHTTPConnection(ASGIHTTPConnection):
+    # Quart receives the whole request body as fast as the client sends it, whether or not
+    # the view reads it, and bounds it with MAX_CONTENT_LENGTH (16 MB) and BODY_TIMEOUT
+    # (60 s). For the paths in `streamed_paths`, whose views read the body line by line,
+    # the next ASGI message is only received once the view has taken the previous one
+    # instead: the buffer never holds more than one message, a slow view slows the client
+    # down (through hypercorn's max_app_queue_size and TCP), and the body has no size or
+    # time limit of its own.
+    streamed_paths = frozenset()
+
+    def _create_request_from_scope(self, send):
+        request = super()._create_request_from_scope(send)
+        if request.path in self.streamed_paths:
+            request.body = StreamedBody()
+            request.max_content_length = None
+            request.body_timeout = None
+        return request
+
+    async def handle_messages(self, request, receive):
+        if not isinstance(request.body, StreamedBody):
+            return await super().handle_messages(request, receive)
+        while True:
+            await request.body.drained.wait()
+            message = await receive()
+            if message['type'] == 'http.request':
+                request.body.append(message.get('body', b''))
+                if not message.get('more_body', False):
+                    request.body.set_complete()
+            elif message['type'] == 'http.disconnect':
+                return
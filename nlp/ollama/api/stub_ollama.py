@@ -0,0 +1,70 @@
+# Minimal stand-in for Ollama, for load tests and the integration tests in tests/ without a
+# GPU/CPU model.
+#
+#   STUB_DELAY_S=2 hypercorn --bind 0.0.0.0:11434 stub_ollama:app
+#
+# /api/chat takes STUB_DELAY_S seconds and answers with STUB_CONTENT (an empty JSON object
+# by default). With "stream": true the content is sent in small NDJSON chunks spread over
+# the same delay, like Ollama does. /api/tags lists STUB_MODELS and /api/ps the ones that
+# have been used, so several stubs can stand in for a pool of Ollama nodes.
+import os
+import json
+import asyncio
+from quart import Quart, request, jsonify
+
+app = Quart(__name__)
+
+delay = float(os.getenv('STUB_DELAY_S', 1.0))
+content = os.getenv('STUB_CONTENT', '{}')
+models = os.getenv('STUB_MODELS', 'llama3.2:3b').split(',')
+# Without STUB_MODELS any model name is accepted
+strict_models = 'STUB_MODELS' in os.environ
+loaded = set()
+
+
+def message(model, text, done):
+    return {
+        'model': model,
+        'message': {'role': 'assistant', 'content': text},
+        'done': done,
+        'prompt_eval_count': 0 if done else None,
+        'eval_count': 1 if done else None,
+        'prompt_eval_duration': 0 if done else None,
+        'eval_duration': int(delay * 1e9) if done else None,
+        'total_duration': int(delay * 1e9) if done else None,
+    }
+
+
+@app.route('/api/tags', methods=['GET'])
+async def tags():
+    return jsonify({'models': [{'name': name, 'model': name} for name in models]})
+
+
+@app.route('/api/ps', methods=['GET'])
+async def ps():
+    return jsonify({'models': [{'name': name, 'model': name} for name in sorted(loaded)]})
+
+
+@app.route('/api/chat', methods=['POST'])
+async def chat():
+    payload = await request.get_json()
+    if strict_models and payload.get('model') not in models:
+        return jsonify({'error': f"model '{payload.get('model')}' not found"}), 404
+    loaded.add(payload.get('model'))
+    if not payload.get('stream', True):
+        await asyncio.sleep(delay)
+        return jsonify(message(payload.get('model'), content, True))
+
+    chunks = [content[i:i + 4] for i in range(0, len(content), 4)]
+
+    async def tokens():
+        for chunk in chunks:
+            await asyncio.sleep(delay / len(chunks))
+            yield json.dumps(message(payload.get('model'), chunk, False)) + '\n'
+        yield json.dumps(message(payload.get('model'), '', True)) + '\n'
+
+    return tokens(), 200, {'Content-Type': 'application/x-ndjson'}
+
+
+if __name__ == '__main__':
+    app.run(host='0.0.0.0', port=11434)
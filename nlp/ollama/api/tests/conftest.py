@@ -0,0 +1,90 @@
+import os
+import sys
+import socket
+import asyncio
+import subprocess
+import time
+
+import httpx
+import pytest
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, API_DIR)
+
+import api
+from admission import AdmissionController
+from ollama_client import OllamaClient
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class Stub:
+    # One stub_ollama.py node in its own hypercorn process
+    def __init__(self, delay_s, content, models):
+        self.url = f'http://127.0.0.1:{free_port()}'
+        env = dict(os.environ, STUB_DELAY_S=str(delay_s), STUB_CONTENT=content, STUB_MODELS=models)
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'hypercorn', '--bind', self.url.removeprefix('http://'), 'stub_ollama:app'],
+            cwd=API_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + 20
+        while True:
+            try:
+                httpx.get(f'{self.url}/api/tags').raise_for_status()
+                return
+            except httpx.HTTPError:
+                if time.monotonic() > deadline or self.process.poll() is not None:
+                    self.stop()
+                    raise RuntimeError('stub_ollama did not start')
+                time.sleep(0.1)
+
+    def stop(self):
+        if self.process.poll() is None:
+            self.process.terminate()
+            self.process.wait(timeout=10)
+
+
+@pytest.fixture
+def stubs():
+    # stubs(n, delay_s=..., content=..., models=...) starts n nodes, all stopped after the test
+    started = []
+
+    def start(count=1, delay_s=0.1, content='{}', models=api.model):
+        nodes = [Stub(delay_s, content, models) for _ in range(count)]
+        started.extend(nodes)
+        return nodes
+
+    yield start
+    for stub in started:
+        stub.stop()
+
+
+@pytest.fixture
+def gateway(monkeypatch):
+    # gateway(urls, max_concurrency=...) points the api at the given Ollama nodes with a
+    # fresh admission controller; use it inside run() as `async with gateway(...) as client`
+    def configure(urls, max_concurrency=4, max_queue=32, reserved=1):
+        monkeypatch.setattr(api, 'ollama', OllamaClient(urls))
+        monkeypatch.setattr(api, 'admission', AdmissionController(max_concurrency, max_queue, reserved))
+        return Gateway()
+
+    return configure
+
+
+class Gateway:
+    # The app with its startup/shutdown hooks run, and a test client for it
+    async def __aenter__(self):
+        self.app = api.app.test_app()
+        await self.app.__aenter__()
+        return self.app.test_client()
+
+    async def __aexit__(self, *exc_info):
+        await self.app.__aexit__(*exc_info)
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
@@ -0,0 +1,111 @@
+import time
+import asyncio
+
+import pytest
+
+from admission import PRIORITY_BATCH, PRIORITY_FIELDS, PRIORITY_SCHEMA, AdmissionController, Rejected
+from conftest import run
+
+
+def later(seconds=5):
+    return time.monotonic() + seconds
+
+
+def test_slots_are_granted_up_to_the_limit_then_queued():
+    async def scenario():
+        admission = AdmissionController(max_concurrency=2, max_queue=4, reserved=0)
+        first = await admission.acquire(PRIORITY_FIELDS, later())
+        await admission.acquire(PRIORITY_FIELDS, later())
+        waiting = asyncio.create_task(admission.acquire(PRIORITY_FIELDS, later()))
+        await asyncio.sleep(0)
+        assert admission.stats()['waiting'] == 1
+        admission.release(first)
+        await waiting
+        return admission.stats()
+
+    stats = run(scenario())
+    assert stats['active'] == 2
+    assert stats['waiting'] == 0
+
+
+def test_reserved_slot_is_only_for_priority_zero():
+    async def scenario():
+        admission = AdmissionController(max_concurrency=2, max_queue=4, reserved=1)
+        await admission.acquire(PRIORITY_SCHEMA, later())
+        schema = asyncio.create_task(admission.acquire(PRIORITY_SCHEMA, later()))
+        await asyncio.sleep(0)
+        # The queued schema request does not hold up /fields, which takes the reserved slot
+        await asyncio.wait_for(admission.acquire(PRIORITY_FIELDS, later()), 1)
+        schema.cancel()
+        return admission.stats()
+
+    stats = run(scenario())
+    assert stats['active'] == 2
+
+
+def test_waiters_are_served_by_priority_then_order():
+    async def scenario():
+        admission = AdmissionController(max_concurrency=1, max_queue=8, reserved=0)
+        started = await admission.acquire(PRIORITY_FIELDS, later())
+        order = []
+
+        async def wait(name, priority):
+            await admission.acquire(priority, later())
+            order.append(name)
+            admission.release(time.monotonic())
+
+        tasks = [asyncio.create_task(wait(name, priority)) for name, priority in
+                 (('batch', PRIORITY_BATCH), ('schema', PRIORITY_SCHEMA), ('fields 1', PRIORITY_FIELDS), ('fields 2', PRIORITY_FIELDS))]
+        await asyncio.sleep(0)
+        admission.release(started)
+        await asyncio.gather(*tasks)
+        return order
+
+    assert run(scenario()) == ['fields 1', 'fields 2', 'schema', 'batch']
+
+
+def test_full_queue_is_rejected_with_429():
+    async def scenario():
+        admission = AdmissionController(max_concurrency=1, max_queue=0, reserved=0)
+        await admission.acquire(PRIORITY_FIELDS, later())
+        with pytest.raises(Rejected) as rejected:
+            await admission.acquire(PRIORITY_FIELDS, later())
+        with pytest.raises(Rejected):
+            admission.check(PRIORITY_FIELDS)
+        return rejected.value, admission.stats()
+
+    rejected, stats = run(scenario())
+    assert rejected.status == 429
+    assert rejected.retry_after_s >= 1
+    assert stats['rejected']['queue_full'] == 2
+
+
+def test_check_lets_through_what_would_be_admitted():
+    admission = AdmissionController(max_concurrency=1, max_queue=0, reserved=0)
+    admission.check(PRIORITY_FIELDS)
+    assert admission.stats()['rejected']['queue_full'] == 0
+
+
+def test_deadline_while_queued_is_a_503_and_leaves_the_queue():
+    async def scenario():
+        admission = AdmissionController(max_concurrency=1, max_queue=4, reserved=0)
+        await admission.acquire(PRIORITY_FIELDS, later())
+        with pytest.raises(Rejected) as rejected:
+            await admission.acquire(PRIORITY_FIELDS, time.monotonic() + 0.05)
+        return rejected.value, admission.stats()
+
+    rejected, stats = run(scenario())
+    assert rejected.status == 503
+    assert stats['waiting'] == 0
+    assert stats['active'] == 1
+
+
+def test_slot_is_released_when_the_body_raises():
+    async def scenario():
+        admission = AdmissionController(max_concurrency=1, max_queue=4, reserved=0)
+        with pytest.raises(RuntimeError):
+            async with admission.slot(PRIORITY_FIELDS, later()):
+                raise RuntimeError('model failed')
+        return admission.stats()
+
+    assert run(scenario())['active'] == 0
@@ -0,0 +1,351 @@
+# The api in front of stub_ollama.py nodes: balancing, ejection, no backends left, the
+# admission slot of a stream whose client goes away, batches, the repair of
+# invalid fields, the model cascade and dictation sessions
+import json
+import asyncio
+
+import api
+import ollama_client
+from sessions import SessionStore
+from conftest import free_port, run
+
+SCHEMA = {'diagnostico': {'type': 'string'}, 'local': {'type': 'string'}}
+TEXT = 'queixa principal e dor no joelho'
+ANSWER = '{"diagnostico": "dor", "local": "joelho"}'
+
+
+def backend_calls(client_stats):
+    return {node['url']: node['calls'] for node in client_stats}
+
+
+def recorded_payloads(monkeypatch):
+    # (schema, model) of every call the api makes to the model
+    payloads = []
+    fields_payload = api.fields_payload
+
+    def record(schema, text, model_name=None):
+        payloads.append((schema, model_name))
+        return fields_payload(schema, text, model_name)
+
+    monkeypatch.setattr(api, 'fields_payload', record)
+    return payloads
+
+
+def test_calls_are_balanced_across_nodes(stubs, gateway):
+    nodes = stubs(2, delay_s=0.3, content=ANSWER)
+
+    async def scenario():
+        async with gateway([node.url for node in nodes], max_concurrency=8) as client:
+            responses = await asyncio.gather(*(client.post('/fields', json={'schema': SCHEMA, 'text': TEXT}) for _ in range(8)))
+            assert [response.status_code for response in responses] == [200] * 8
+            assert json.loads(await responses[0].get_json()) == {'diagnostico': 'dor', 'local': 'joelho'}
+            return await (await client.get('/backends')).get_json()
+
+    calls = backend_calls(run(scenario()))
+    assert sorted(calls.values()) == [4, 4]
+
+
+def test_failing_node_is_ejected(stubs, gateway, monkeypatch):
+    dead, alive = stubs(2, delay_s=0.05, content=ANSWER)
+    # Ties always go to the first node, the one that is about to fail; once the other one
+    # has the model loaded it is preferred anyway, so one failure has to be enough
+    monkeypatch.setattr(ollama_client.random, 'choice', lambda nodes: nodes[0])
+    monkeypatch.setenv('OLLAMA_EJECT_AFTER', '1')
+
+    async def scenario():
+        async with gateway([dead.url, alive.url]) as client:
+            dead.stop()
+            statuses = [(await client.post('/fields', json={'schema': SCHEMA, 'text': TEXT})).status_code for _ in range(4)]
+            return statuses, await (await client.get('/backends')).get_json()
+
+    statuses, backends = run(scenario())
+    # Connection errors are retried on the other node, so no request fails
+    assert statuses == [200] * 4
+    by_url = {node['url']: node for node in backends}
+    assert by_url[dead.url]['healthy'] is False
+    assert by_url[dead.url]['calls'] == 1
+    assert by_url[alive.url]['calls'] == 4
+
+
+def test_no_backend_answers_503(gateway):
+    async def scenario():
+        # Nothing listens there, so the startup health check already ejects it
+        async with gateway([f'http://127.0.0.1:{free_port()}']) as client:
+            return await client.post('/fields', json={'schema': SCHEMA, 'text': TEXT})
+
+    response = run(scenario())
+    assert response.status_code == 503
+    assert 'Retry-After' in response.headers
+
+
+def test_stream_closed_early_releases_admission_slot(stubs, gateway):
+    node, = stubs(delay_s=1.0, content=ANSWER)
+    # The e-mail is filled by the rules, so its event comes before the model is even called
+    schema = {**SCHEMA, 'email': {'type': 'string'}}
+    text = f'{TEXT}, email ana@example.com'
+
+    async def scenario():
+        async with gateway([node.url], max_concurrency=1, reserved=0) as client:
+            # Closed right after the rule-based event, and closed without ever being started
+            for events_read in (1, 0):
+                async with api.app.test_request_context('/fields/stream', method='POST', json={'schema': schema, 'text': text}):
+                    response = await api.fields_stream()
+                    assert response.status_code == 200
+                    async with response.response as events:
+                        for _ in range(events_read):
+                            assert (await anext(aiter(events))).startswith('event: field')
+            stats = api.admission.stats()
+            response = await client.post('/fields', json={'schema': SCHEMA, 'text': TEXT}, headers={'X-Request-Timeout': '5'})
+            return stats, response
+
+    stats, response = run(scenario())
+    assert stats['active'] == 0
+    assert response.status_code == 200
+
+
+def test_stream_disconnect_releases_admission_slot(stubs, gateway):
+    node, = stubs(delay_s=1.0, content=ANSWER)
+
+    async def scenario():
+        async with gateway([node.url], max_concurrency=1, reserved=0) as client:
+            for _ in range(3):
+                async with client.request('/fields/stream', method='POST', headers={'Content-Type': 'application/json'}) as connection:
+                    await connection.send(json.dumps({'schema': SCHEMA, 'text': TEXT}).encode())
+                    await connection.send_complete()
+                    received = b''
+                    while b'event: field' not in received:
+                        received += await connection.receive()
+                    # The client goes away in the middle of the stream
+                    await connection.disconnect()
+            await asyncio.sleep(0.1)
+            stats = api.admission.stats()
+            response = await client.post('/fields', json={'schema': SCHEMA, 'text': TEXT})
+            return stats, response
+
+    stats, response = run(scenario())
+    assert stats['active'] == 0
+    assert response.status_code == 200
+
+
+def test_stream_outlives_the_response_timeout(stubs, gateway, monkeypatch):
+    node, = stubs(delay_s=1.5, content=ANSWER)
+    monkeypatch.setitem(api.app.config, 'RESPONSE_TIMEOUT', 0.5)
+
+    async def scenario():
+        async with gateway([node.url]) as client:
+            response = await client.post('/fields/stream', json={'schema': SCHEMA, 'text': TEXT})
+            return (await response.get_data()).decode()
+
+    assert 'event: done' in run(scenario())
+
+
+def test_stream_answers_429_when_the_queue_is_full(stubs, gateway):
+    node, = stubs(delay_s=1.0, content=ANSWER)
+
+    async def scenario():
+        async with gateway([node.url], max_concurrency=1, max_queue=0, reserved=0) as client:
+            busy = asyncio.create_task(client.post('/fields', json={'schema': SCHEMA, 'text': TEXT}))
+            while not api.admission.active:
+                await asyncio.sleep(0.01)
+            rejected = await client.post('/fields/stream', json={'schema': SCHEMA, 'text': TEXT})
+            await busy
+            return rejected
+
+    response = run(scenario())
+    assert response.status_code == 429
+    assert 'Retry-After' in response.headers
+
+
+def test_full_json_schema_is_answered_by_field(stubs, gateway):
+    node, = stubs(delay_s=0.05, content=ANSWER)
+    wrapped = {'type': 'object', 'properties': SCHEMA}
+
+    async def scenario():
+        async with gateway([node.url]) as client:
+            response = await client.post('/fields', json={'schema': wrapped, 'text': TEXT})
+            return json.loads(await response.get_json())
+
+    assert run(scenario()) == {'diagnostico': 'dor', 'local': 'joelho'}
+
+
+def test_missing_or_non_object_schema_is_a_400(gateway, monkeypatch):
+    monkeypatch.setattr(api, 'compact_schema', True)
+
+    async def scenario():
+        async with gateway([f'http://127.0.0.1:{free_port()}']) as client:
+            return [(await client.post(path, json={**body, 'text': TEXT})).status_code
+                    for path in ('/fields', '/fields/stream')
+                    for body in ({}, {'schema': ['diagnostico']}, {'schema': 'diagnostico'})]
+
+    assert run(scenario()) == [400] * 6
+
+
+def test_prefilled_fields_keep_the_full_schema_prompt(stubs, gateway, monkeypatch):
+    # The model is wrong about the e-mail, which the rules already know
+    node, = stubs(delay_s=0.05, content='{"diagnostico": "dor", "local": "joelho", "email": "errado"}')
+    schema = {**SCHEMA, 'email': {'type': 'string'}}
+    body = {'schema': schema, 'text': f'{TEXT}, email ana@example.com'}
+    payloads = recorded_payloads(monkeypatch)
+
+    async def scenario():
+        async with gateway([node.url]) as client:
+            filled = json.loads(await (await client.post('/fields', json=body)).get_json())
+            streamed = (await (await client.post('/fields/stream', json=body)).get_data()).decode()
+            return filled, streamed
+
+    filled, streamed = run(scenario())
+    assert payloads == [(schema, None), (schema, None)]
+    assert filled == {'diagnostico': 'dor', 'local': 'joelho', 'email': 'ana@example.com'}
+    assert 'errado' not in streamed
+    assert streamed.rstrip().endswith(api.sse(filled, 'done').rstrip())
+
+
+def batch_body(*lines):
+    return ''.join(json.dumps(line, ensure_ascii=False) + '\n' for line in lines).encode()
+
+
+def test_batch_outlives_the_response_timeout(stubs, gateway, monkeypatch):
+    node, = stubs(delay_s=0.4, content=ANSWER)
+    monkeypatch.setitem(api.app.config, 'RESPONSE_TIMEOUT', 0.5)
+
+    async def scenario():
+        async with gateway([node.url]) as client:
+            response = await client.post('/fields/batch', data=batch_body({'schema': SCHEMA}, TEXT, TEXT, TEXT, TEXT))
+            return [json.loads(line) for line in (await response.get_data()).splitlines()]
+
+    lines = run(scenario())
+    assert [line.get('status') for line in lines[:-1]] == [200] * 4
+    assert lines[-1]['done'] is True
+
+
+def test_batch_body_is_not_limited_to_max_content_length(stubs, gateway):
+    node, = stubs(delay_s=0.05, content=ANSWER)
+    # Blank lines are skipped, so this is one text past 16 MB of body
+    body = batch_body({'schema': SCHEMA}) + b'\n' * (api.app.config['MAX_CONTENT_LENGTH'] + 1) + batch_body(TEXT)
+
+    async def scenario():
+        async with gateway([node.url]) as client:
+            response = await client.post('/fields/batch', data=body)
+            return response.status_code, [json.loads(line) for line in (await response.get_data()).splitlines()]
+
+    status, lines = run(scenario())
+    assert status == 200
+    assert lines[0]['fields'] == {'diagnostico': 'dor', 'local': 'joelho'}
+    assert lines[-1]['items'] == 1
+
+
+def test_batch_answers_in_input_order_and_bad_lines_do_not_stop_it(stubs, gateway):
+    node, = stubs(delay_s=0.05, content=ANSWER)
+    body = batch_body({'schema': SCHEMA}, {'id': 'a', 'text': TEXT}, {'id': 'b', 'text': 42}, TEXT) + b'{not json\n' + batch_body({'id': 'c', 'text': TEXT})
+
+    async def scenario():
+        async with gateway([node.url]) as client:
+            response = await client.post('/fields/batch', data=body)
+            return response.headers['Content-Type'], [json.loads(line) for line in (await response.get_data()).splitlines()]
+
+    content_type, lines = run(scenario())
+    assert content_type == 'application/x-ndjson'
+    *results, summary = lines
+    assert [(result['index'], result.get('id'), result['status']) for result in results] == [
+        (0, 'a', 200), (1, 'b', 400), (2, None, 200), (3, None, 400), (4, 'c', 200),
+    ]
+    assert results[4]['fields'] == {'diagnostico': 'dor', 'local': 'joelho'}
+    assert summary['items'] == 5
+    assert summary['errors'] == 2
+
+
+def test_batch_without_a_schema_line_is_a_400(gateway):
+    async def scenario():
+        async with gateway([f'http://127.0.0.1:{free_port()}']) as client:
+            return await client.post('/fields/batch', data=batch_body(TEXT))
+
+    assert run(scenario()).status_code == 400
+
+
+def test_repair_asks_again_only_for_the_invalid_fields(stubs, gateway, monkeypatch):
+    # The stub gives the same answer every time, so the age is still invalid after the repair
+    node, = stubs(delay_s=0.05, content='{"idade": "quarenta", "local": "joelho"}')
+    schema = {'idade': {'type': 'number'}, 'local': {'type': 'string'}}
+    monkeypatch.setattr(api, 'repair_attempts', 1)
+    payloads = recorded_payloads(monkeypatch)
+
+    async def scenario():
+        async with gateway([node.url]) as client:
+            response = await client.post('/fields', json={'schema': schema, 'text': 'dor no joelho'})
+            return json.loads(await response.get_json())
+
+    assert run(scenario()) == {'idade': None, 'local': 'joelho'}
+    assert [schema for schema, _ in payloads] == [schema, {'idade': {'type': 'number'}}]
+
+
+def test_answer_that_is_never_json_is_a_502(stubs, gateway, monkeypatch):
+    node, = stubs(delay_s=0.05, content='não sei')
+    monkeypatch.setattr(api, 'repair_attempts', 1)
+    payloads = recorded_payloads(monkeypatch)
+
+    async def scenario():
+        async with gateway([node.url]) as client:
+            return await client.post('/fields', json={'schema': SCHEMA, 'text': TEXT})
+
+    assert run(scenario()).status_code == 502
+    assert [schema for schema, _ in payloads] == [SCHEMA, SCHEMA]
+
+
+def test_cascade_escalates_only_the_doubtful_fields(stubs, gateway, monkeypatch):
+    # "fratura" is nowhere in the text, so the large model is asked about the diagnosis only
+    small, = stubs(delay_s=0.05, content='{"diagnostico": "fratura", "local": "joelho"}', models='small')
+    large, = stubs(delay_s=0.05, content='{"diagnostico": "dor", "local": "pé"}', models='large')
+    monkeypatch.setattr(api, 'cascade_models', ['small', 'large'])
+    payloads = recorded_payloads(monkeypatch)
+
+    async def scenario():
+        async with gateway([small.url, large.url]) as client:
+            escalated = json.loads(await (await client.post('/fields', json={'schema': SCHEMA, 'text': TEXT})).get_json())
+            calls = list(payloads)
+            payloads.clear()
+            confident = json.loads(await (await client.post('/fields', json={'schema': SCHEMA, 'text': 'fratura no joelho'})).get_json())
+            return escalated, calls, confident
+
+    escalated, calls, confident = run(scenario())
+    assert escalated == {'diagnostico': 'dor', 'local': 'joelho'}
+    assert calls == [(SCHEMA, 'small'), ({'diagnostico': SCHEMA['diagnostico']}, 'large')]
+    assert confident == {'diagnostico': 'fratura', 'local': 'joelho'}
+    assert payloads == [(SCHEMA, 'small')]
+
+
+def test_session_asks_only_for_the_targets_and_merges_them(stubs, gateway, monkeypatch):
+    node, = stubs(delay_s=0.05, content='{"diagnostico": "dor", "local": null, "email": "errado@example.com"}')
+    schema = {**SCHEMA, 'email': {'type': 'string'}}
+    payloads = recorded_payloads(monkeypatch)
+
+    async def scenario():
+        async with gateway([node.url]) as client:
+            session = (await (await client.post('/sessions', json={'schema': schema})).get_json())['session']
+            first = await (await client.post(f'/sessions/{session}/utterances', json={'text': 'dor, email ana@example.com'})).get_json()
+            second = await (await client.post(f'/sessions/{session}/utterances', json={'text': 'no joelho'})).get_json()
+            return first, second
+
+    first, second = run(scenario())
+    # The e-mail comes from the rules and the diagnosis from the model; after that only the
+    # place is still empty, and the model's echo of the other fields is ignored
+    assert first['updated'] == ['diagnostico', 'email']
+    assert [schema for schema, _ in payloads] == [SCHEMA, {'local': SCHEMA['local']}]
+    assert second['updated'] == []
+    assert second['fields'] == {'diagnostico': 'dor', 'local': None, 'email': 'ana@example.com'}
+    assert second['utterances'] == 2
+
+
+def test_sessions_are_evicted_least_recently_used_first(gateway, monkeypatch):
+    monkeypatch.setattr(api, 'sessions', SessionStore(max_sessions=2))
+
+    async def scenario():
+        async with gateway([f'http://127.0.0.1:{free_port()}']) as client:
+            first, second = [(await (await client.post('/sessions', json={'schema': SCHEMA})).get_json())['session'] for _ in range(2)]
+            await client.get(f'/sessions/{first}')
+            await client.post('/sessions', json={'schema': SCHEMA})
+            statuses = [(await client.get(f'/sessions/{session}')).status_code for session in (first, second)]
+            return statuses, await (await client.get('/sessions')).get_json()
+
+    statuses, stats = run(scenario())
+    assert statuses == [200, 404]
+    assert stats['evicted'] == 1
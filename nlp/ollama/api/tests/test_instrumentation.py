@@ -0,0 +1,8 @@
+import instrumentation
+
+
+def test_metrics_are_exposed():
+    instrumentation.observe_stage('test_stage', 0.2)
+    body, content_type = instrumentation.metrics()
+    assert content_type.startswith('text/plain')
+    assert b'stage_duration_seconds_count{stage="test_stage"} 1.0' in body
@@ -0,0 +1,31 @@
+from json_stream import JsonFieldStream
+
+
+def feed_in_chunks(text, size):
+    parser = JsonFieldStream()
+    completed = []
+    for i in range(0, len(text), size):
+        completed.extend(parser.feed(text[i:i + size]))
+    return parser, completed
+
+
+def test_fields_are_emitted_as_soon_as_they_are_complete():
+    parser = JsonFieldStream()
+    assert parser.feed('{"nome": "Ana", "ida') == [('nome', 'Ana')]
+    # A number is only complete at the next , or }
+    assert parser.feed('de": 42') == []
+    assert parser.feed(', "ativo": true}') == [('idade', 42), ('ativo', True)]
+
+
+def test_nested_values_and_escapes_survive_any_chunking():
+    text = '{"a": {"b": [1, 2, {"c": "}"}]}, "d": "x \\" y", "e": null, "f": [], "g": 1.5}'
+    expected = {'a': {'b': [1, 2, {'c': '}'}]}, 'd': 'x " y', 'e': None, 'f': [], 'g': 1.5}
+    for size in (1, 3, 7, len(text)):
+        parser, completed = feed_in_chunks(text, size)
+        assert parser.fields == expected
+        assert [key for key, _ in completed] == list(expected)
+
+
+def test_invalid_values_are_skipped():
+    parser, completed = feed_in_chunks('{"a": nope, "b": 2}', 4)
+    assert completed == [('b', 2)]
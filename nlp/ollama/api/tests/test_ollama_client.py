@@ -0,0 +1,63 @@
+import pytest
+
+from ollama_client import NoBackendError, OllamaClient, combine_timings, ollama_timings
+
+MODEL = 'llama3.2:3b'
+
+
+def client(count=3):
+    ollama = OllamaClient([f'http://node{i}:11434' for i in range(count)])
+    for backend in ollama.backends:
+        backend.models = {MODEL}
+    return ollama
+
+
+def test_pick_prefers_the_least_busy_node():
+    ollama = client()
+    for backend, outstanding in zip(ollama.backends, (3, 1, 2)):
+        backend.outstanding = outstanding
+    assert ollama.pick(MODEL) is ollama.backends[1]
+
+
+def test_pick_prefers_a_node_with_the_model_loaded_within_the_slack():
+    ollama = client()
+    ollama.affinity_slack = 2
+    warm = ollama.backends[0]
+    warm.loaded = {MODEL}
+    warm.outstanding = 2
+    assert ollama.pick(MODEL) is warm
+    warm.outstanding = 3
+    assert ollama.pick(MODEL) is not warm
+
+
+def test_pick_skips_ejected_excluded_and_modelless_nodes():
+    ollama = client()
+    ollama.backends[0].healthy = False
+    ollama.backends[1].models = {'other'}
+    assert ollama.pick(MODEL) is ollama.backends[2]
+    with pytest.raises(NoBackendError):
+        ollama.pick(MODEL, exclude=[ollama.backends[2]])
+
+
+def test_failures_in_a_row_eject_a_node():
+    ollama = client()
+    ollama.eject_after = 2
+    backend = ollama.backends[0]
+    ollama._failed(backend, 'boom')
+    ollama._succeeded(backend, MODEL)
+    ollama._failed(backend, 'boom')
+    assert backend.healthy
+    ollama._failed(backend, 'boom')
+    assert not backend.healthy
+
+
+def test_timings_are_converted_and_combined():
+    timings = ollama_timings({'eval_duration': 2e9, 'total_duration': 3e9, 'eval_count': 40, 'prompt_eval_count': 100})
+    assert timings['eval_ms'] == 2000.0
+    assert timings['tokens_per_s'] == 20.0
+    parallel = combine_timings([timings, timings])
+    assert parallel['total_ms'] == 3000.0
+    assert parallel['output_tokens'] == 80
+    sequential = combine_timings([timings, timings], parallel=False)
+    assert sequential['total_ms'] == 6000.0
+    assert sequential['tokens_per_s'] == 20.0
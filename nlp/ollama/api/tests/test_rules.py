@@ -0,0 +1,36 @@
+from rules import prefill
+
+SCHEMA = {
+    'idade': {'type': 'number'},
+    'email': {'type': 'string'},
+    'telefone': {'type': 'string'},
+    'data_nascimento': {'type': 'string', 'format': 'date'},
+    'nivel_dor': {'type': 'number'},
+    'fumador': {'type': 'boolean'},
+    'tamanho_ferida': {'type': 'object', 'properties': {'valor': {'type': 'number'}, 'unidade': {'type': 'string'}}},
+    'diagnostico': {'type': 'string'},
+}
+
+
+def test_fields_with_exactly_one_candidate_are_filled():
+    text = ('Paciente com 42 anos, e-mail Ana.Silva@example.com, telefone 912345678, nascida em '
+            '3 de março de 1982. Dor 7 em 10 no joelho. Não é fumador. Ferida com 2,5 cm.')
+    assert prefill(SCHEMA, text) == {
+        'idade': 42,
+        'email': 'Ana.Silva@example.com',
+        'telefone': '912345678',
+        'data_nascimento': '1982-03-03',
+        'nivel_dor': 7,
+        'fumador': False,
+        'tamanho_ferida': {'valor': 2.5, 'unidade': 'cm'},
+    }
+
+
+def test_ambiguous_or_absent_values_are_left_to_the_model():
+    text = 'Tem 42 anos e o irmão 45 anos. Ferida de 2 cm e outra de 3 cm.'
+    assert prefill(SCHEMA, text) == {}
+
+
+def test_two_fields_of_the_same_kind_are_not_guessed():
+    schema = {'email': {'type': 'string'}, 'email_alternativo': {'type': 'string'}}
+    assert prefill(schema, 'o email é ana@example.com') == {}
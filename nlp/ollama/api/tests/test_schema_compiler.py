@@ -0,0 +1,61 @@
+import json
+
+from schema_compiler import compact_json_schema, compile_schema, unwrap
+
+SCHEMA = {
+    'idade': {'type': 'integer', 'description': 'Idade do paciente'},
+    'estadio': {'type': 'string', 'description': 'Estadio da ferida (I, II, III, IV)', 'enum': ['I', 'II', 'III', 'IV']},
+    'data_inicio': {'type': 'string', 'format': 'date'},
+    'alergias': {'type': 'array', 'items': {'type': 'string'}},
+    'tamanho': {'type': 'object', 'properties': {'valor': {'type': 'number'}, 'unidade': {'type': 'string'}}},
+}
+
+
+def test_full_json_schema_is_unwrapped():
+    assert unwrap({'type': 'object', 'properties': SCHEMA}) == SCHEMA
+    assert unwrap(SCHEMA) == SCHEMA
+    assert compile_schema({'type': 'object', 'properties': SCHEMA}).fields == SCHEMA
+
+
+def test_template_has_type_hints_and_only_useful_descriptions():
+    template = compile_schema(SCHEMA).template
+    assert template == {
+        'idade': 'int',
+        'estadio': 'str (I, II, III, IV)',
+        'data_inicio': 'date YYYY-MM-DD',
+        'alergias': ['str'],
+        'tamanho': {'valor': 'num', 'unidade': 'str'},
+    }
+    assert json.loads(compile_schema(SCHEMA).prompt) == template
+
+
+def test_output_schema_makes_every_field_required_and_nullable():
+    output = compile_schema(SCHEMA).output_schema
+    assert output['required'] == list(SCHEMA)
+    assert output['additionalProperties'] is False
+    assert output['properties']['idade']['type'] == ['integer', 'null']
+    assert output['properties']['estadio']['enum'] == ['I', 'II', 'III', 'IV', None]
+    assert output['properties']['alergias']['items'] == {'type': 'string'}
+
+
+def test_validate_returns_the_fields_that_do_not_fit():
+    validate = compile_schema(SCHEMA).validate
+    assert validate({'idade': 40, 'estadio': 'II', 'data_inicio': '2024-01-31', 'alergias': ['pólen'], 'tamanho': {'valor': 2, 'unidade': 'cm'}}) == []
+    assert validate({}) == []
+    assert validate({'idade': 'quarenta', 'estadio': 'V', 'data_inicio': '31/01/2024', 'alergias': 'pólen', 'tamanho': {'valor': 'dois'}}) == list(SCHEMA)
+    # A bool is not a number
+    assert validate({'idade': True}) == ['idade']
+
+
+def test_large_forms_are_split_in_sections():
+    schema = {f'campo_{i}': {'type': 'string'} for i in range(10)}
+    sections = compile_schema(schema, section_size=4).sections
+    assert [len(section) for section in sections] == [4, 4, 2]
+    assert compile_schema(schema).sections == [schema]
+    assert [name for section in sections for name in section] == list(schema)
+
+
+def test_compact_json_schema_drops_descriptions_that_repeat_the_name():
+    compact = compact_json_schema(SCHEMA)
+    assert 'description' not in compact['idade']
+    assert compact['estadio']['description'] == 'Estadio da ferida (I, II, III, IV)'
@@ -0,0 +1,46 @@
+import asyncio
+
+from api import app
+from streamed_body import StreamedBody, StreamedHTTPConnection
+from conftest import run
+
+
+class Connection(StreamedHTTPConnection):
+    streamed_paths = frozenset({'/stream'})
+
+
+def scope(path):
+    return {'type': 'http', 'method': 'POST', 'scheme': 'http', 'path': path, 'query_string': b'',
+            'headers': [(b'content-length', b'100000000')], 'http_version': '1.1', 'client': ('127.0.0.1', 1)}
+
+
+def test_only_streamed_paths_lose_the_body_limits():
+    streamed = Connection(app, scope('/stream'))._create_request_from_scope(None)
+    regular = Connection(app, scope('/fields'))._create_request_from_scope(None)
+    assert isinstance(streamed.body, StreamedBody)
+    assert streamed.body_timeout is None
+    assert not isinstance(regular.body, StreamedBody)
+    assert regular.body_timeout == app.config['BODY_TIMEOUT']
+
+
+def test_messages_are_only_received_as_the_body_is_read():
+    async def scenario():
+        connection = Connection(app, scope('/stream'))
+        request = connection._create_request_from_scope(None)
+        received = []
+
+        async def receive():
+            received.append(len(received))
+            more = len(received) < 5
+            return {'type': 'http.request', 'body': b'line\n', 'more_body': more}
+
+        reader = asyncio.create_task(connection.handle_messages(request, receive))
+        await asyncio.sleep(0.05)
+        before_reading = len(received)
+        chunks = [chunk async for chunk in request.body]
+        reader.cancel()
+        return before_reading, chunks
+
+    before_reading, chunks = run(scenario())
+    assert before_reading == 1
+    assert chunks == [b'line\n'] * 5
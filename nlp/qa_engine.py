@@ -0,0 +1,175 @@
+import re
+import torch
+from transformers import AutoTokenizer, AutoModelForQuestionAnswering
+
+# Extractive QA alternative to an LLM call for simple forms: one question per schema leaf,
+# the context is tokenized once and every question goes through the model in a single
+# padded batch. Works with the SQuAD2 checkpoints tried in nlp/models/test_*.py.
+
+DEFAULT_MODEL = "deepset/roberta-base-squad2"
+
+MONTHS = {
+    'janeiro': 1, 'fevereiro': 2, 'março': 3, 'marco': 3, 'abril': 4, 'maio': 5, 'junho': 6,
+    'julho': 7, 'agosto': 8, 'setembro': 9, 'outubro': 10, 'novembro': 11, 'dezembro': 12,
+}
+NEGATIONS = re.compile(r'\b(não|nao|sem|nenhum|nenhuma|ausência|ausencia|negativo)\b', re.IGNORECASE)
+NUMBER = re.compile(r'[-+]?\d+(?:[.,]\d+)?')
+
+
+def schema_leaves(schema, prefix=()):
+    # (path, field schema) for every leaf the engine can fill; arrays of objects are left to
+    # the LLM and stay None
+    for name, field in schema.items():
+        if not isinstance(field, dict):
+            continue
+        if field.get('type') == 'object' and 'properties' in field:
+            yield from schema_leaves(field['properties'], prefix + (name,))
+        elif field.get('type') != 'array' or field.get('items', {}).get('type') != 'object':
+            yield prefix + (name,), field
+
+
+def empty_form(schema):
+    return {
+        name: empty_form(field['properties']) if isinstance(field, dict) and field.get('type') == 'object' and 'properties' in field else None
+        for name, field in schema.items()
+    }
+
+
+def question_for(path, field):
+    description = field.get('description') or ' '.join(part.replace('_', ' ') for part in path)
+    return f"{description.rstrip('.?')}?"
+
+
+def convert(answer, field, context):
+    field_type = field.get('type')
+    if field_type in ('number', 'integer'):
+        match = NUMBER.search(answer)
+        if not match:
+            return None
+        number = float(match.group().replace(',', '.'))
+        return int(number) if field_type == 'integer' or number.is_integer() else number
+    if field_type == 'boolean':
+        # The span points at the mention; a negation in the sentence around it flips it
+        start = context.find(answer)
+        sentence = context[max(0, context.rfind('.', 0, start) + 1):start + len(answer) + 1] if start >= 0 else answer
+        return not NEGATIONS.search(sentence)
+    if field_type == 'array':
+        return [item.strip() for item in re.split(r',|\be\b', answer) if item.strip()]
+    if field.get('format') == 'date':
+        return parse_date(answer) or answer
+    return answer
+
+
+def parse_date(text):
+    match = re.search(r'(\d{1,2})\s+de\s+(\w+)\s+de\s+(\d{4})', text, re.IGNORECASE)
+    if match and match.group(2).lower() in MONTHS:
+        return f"{match.group(3)}-{MONTHS[match.group(2).lower()]:02d}-{int(match.group(1)):02d}"
+    match = re.search(r'(\d{1,2})[/-](\d{1,2})[/-](\d{4})', text)
+    if match:
+        return f"{match.group(3)}-{int(match.group(2)):02d}-{int(match.group(1)):02d}"
+    return None
+
+
+class ExtractiveQA:
+    def __init__(self, model_name=DEFAULT_MODEL, max_answer_tokens=30, max_length=384, stride=128, null_margin=0.0):
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = AutoModelForQuestionAnswering.from_pretrained(model_name)
+        self.model.eval()
+        self.max_answer_tokens = max_answer_tokens
+        self.max_length = max_length
+        self.stride = stride
+        self.null_margin = null_margin
+        self.questions = {}
+
+        # Learn where the special tokens go in a (question, context) pair once, so pairs can
+        # be assembled from already tokenized pieces
+        probe = self.tokenizer('a', 'b')
+        ids, sequence = probe['input_ids'], probe.sequence_ids()
+        first_b = sequence.index(1)
+        last_a = len(sequence) - 1 - sequence[::-1].index(0)
+        last_b = len(sequence) - 1 - sequence[::-1].index(1)
+        self.prefix = ids[:sequence.index(0)]
+        self.middle = ids[last_a + 1:first_b]
+        self.suffix = ids[last_b + 1:]
+        self.context_type = probe['token_type_ids'][first_b] if 'token_type_ids' in probe else None
+
+    def _question_ids(self, question):
+        if question not in self.questions:
+            self.questions[question] = self.tokenizer(question, add_special_tokens=False)['input_ids']
+        return self.questions[question]
+
+    def _windows(self, context_ids, question_ids):
+        # Contexts longer than the model allows are covered with overlapping windows
+        room = self.max_length - max(len(q) for q in question_ids) - len(self.prefix) - len(self.middle) - len(self.suffix)
+        if room <= 0:
+            raise ValueError("Questions are too long for the model")
+        starts = [0]
+        while starts[-1] + room < len(context_ids):
+            starts.append(starts[-1] + max(1, room - self.stride))
+        return [(start, context_ids[start:start + room]) for start in starts]
+
+    def answer(self, context, questions):
+        encoded = self.tokenizer(context, add_special_tokens=False, return_offsets_mapping=True)
+        context_ids, offsets = encoded['input_ids'], encoded['offset_mapping']
+        question_ids = [self._question_ids(q) for q in questions]
+
+        rows, layout = [], []
+        for window_start, window in self._windows(context_ids, question_ids):
+            for index, q_ids in enumerate(question_ids):
+                first = len(self.prefix) + len(q_ids) + len(self.middle)
+                rows.append(self.prefix + q_ids + self.middle + window + self.suffix)
+                layout.append((index, window_start, first, len(window)))
+
+        width = max(len(ids) for ids in rows)
+        input_ids = torch.full((len(rows), width), self.tokenizer.pad_token_id, dtype=torch.long)
+        attention_mask = torch.zeros((len(rows), width), dtype=torch.long)
+        token_type_ids = torch.zeros((len(rows), width), dtype=torch.long)
+        context_mask = torch.zeros((len(rows), width), dtype=torch.bool)
+        for row, (ids, (_, _, first, length)) in enumerate(zip(rows, layout)):
+            input_ids[row, :len(ids)] = torch.tensor(ids)
+            attention_mask[row, :len(ids)] = 1
+            token_type_ids[row, first:len(ids)] = self.context_type or 0
+            context_mask[row, first:first + length] = True
+
+        inputs = {'input_ids': input_ids, 'attention_mask': attention_mask}
+        if self.context_type is not None:
+            inputs['token_type_ids'] = token_type_ids
+        with torch.no_grad():
+            outputs = self.model(**inputs)
+
+        # Best span with start <= end and at most max_answer_tokens long, inside the context,
+        # scored as start_logit + end_logit; the [CLS] score is the "no answer" option
+        start_logits = outputs.start_logits.float()
+        end_logits = outputs.end_logits.float()
+        null_scores = start_logits[:, 0] + end_logits[:, 0]
+        start_logits = start_logits.masked_fill(~context_mask, float('-inf'))
+        end_logits = end_logits.masked_fill(~context_mask, float('-inf'))
+        scores = start_logits[:, :, None] + end_logits[:, None, :]
+        band = torch.triu(torch.ones(width, width, dtype=torch.bool)) & ~torch.triu(torch.ones(width, width, dtype=torch.bool), self.max_answer_tokens)
+        scores = scores.masked_fill(~band, float('-inf'))
+        best_scores, best = scores.view(len(rows), -1).max(dim=1)
+
+        answers = [(float('-inf'), None)] * len(questions)
+        for row, (index, window_start, first, _) in enumerate(layout):
+            score = best_scores[row].item()
+            if score == float('-inf') or score < null_scores[row].item() + self.null_margin or score <= answers[index][0]:
+                continue
+            start, end = divmod(best[row].item(), width)
+            char_start = offsets[window_start + start - first][0]
+            char_end = offsets[window_start + end - first][1]
+            answers[index] = (score, context[char_start:char_end].strip())
+        return [text for _, text in answers]
+
+    def fill(self, schema, context, questions=None):
+        # questions: optional {"field.path": "question"} overrides for the generated ones
+        leaves = list(schema_leaves(schema))
+        asked = [(questions or {}).get('.'.join(path)) or question_for(path, field) for path, field in leaves]
+        answers = self.answer(context, asked) if leaves else []
+
+        result = empty_form(schema)
+        for (path, field), text in zip(leaves, answers):
+            target = result
+            for part in path[:-1]:
+                target = target[part]
+            target[path[-1]] = convert(text, field, context) if text else None
+        return result
@@ -0,0 +1,127 @@
+import re
+import unicodedata
+from collections import namedtuple
+
+import numpy as np
+
+# One compared leaf: path like "tamanho_ferida.valor" or "alergias[0]", the two values,
+# and whether they matched
+FieldDiff = namedtuple('FieldDiff', ['path', 'expected', 'generated', 'correct'])
+Score = namedtuple('Score', ['correct', 'total', 'diff'])
+
+_SPACES = re.compile(r'\s+')
+_NUMBER = re.compile(r'^[+-]?(\d+([.,]\d*)?|[.,]\d+)$')
+
+
+def normalize_string(value):
+    # Case, accents, surrounding punctuation and repeated whitespace do not count
+    value = unicodedata.normalize('NFKD', value)
+    value = ''.join(c for c in value if not unicodedata.combining(c))
+    return _SPACES.sub(' ', value.casefold()).strip(' .;:')
+
+
+def as_number(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str) and _NUMBER.match(value.strip()):
+        return float(value.strip().replace(',', '.'))
+    return None
+
+
+def values_equal(expected, generated):
+    if expected is None or generated is None:
+        return expected is generated
+    if isinstance(expected, bool) or isinstance(generated, bool):
+        return expected is generated
+    expected_number, generated_number = as_number(expected), as_number(generated)
+    if expected_number is not None and generated_number is not None:
+        return abs(expected_number - generated_number) <= 1e-6 * max(1.0, abs(expected_number))
+    if isinstance(expected, str) and isinstance(generated, str):
+        return normalize_string(expected) == normalize_string(generated)
+    return expected == generated
+
+
+def _match_list(path, expected, generated, stack):
+    # Order-insensitive: every expected item is paired with the best still unused generated
+    # item (equal scalar, or the dict/list with the most matching leaves); leftovers on the
+    # expected side are compared against None
+    unused = list(range(len(generated))) if isinstance(generated, list) else []
+    for i, item in enumerate(expected):
+        best, best_correct = None, -1
+        for j in unused:
+            if isinstance(item, (dict, list)):
+                correct = score(item, generated[j]).correct if isinstance(generated[j], type(item)) else -1
+            else:
+                correct = 1 if values_equal(item, generated[j]) else -1
+            if correct > best_correct:
+                best, best_correct = j, correct
+            if correct == 1 and not isinstance(item, (dict, list)):
+                break
+        if best is not None and best_correct >= 0:
+            unused.remove(best)
+            stack.append((f"{path}[{i}]", item, generated[best]))
+        else:
+            stack.append((f"{path}[{i}]", item, None))
+
+
+def score(expected, generated):
+    correct, total, diff = 0, 0, []
+    stack = [('', expected, generated)]
+    while stack:
+        path, exp, gen = stack.pop()
+        if isinstance(exp, dict):
+            gen = gen if isinstance(gen, dict) else {}
+            for key in reversed(list(exp)):
+                stack.append((f"{path}.{key}" if path else key, exp[key], gen.get(key)))
+        elif isinstance(exp, list):
+            _match_list(path, exp, gen, stack)
+        else:
+            ok = values_equal(exp, gen)
+            correct += ok
+            total += 1
+            diff.append(FieldDiff(path, exp, gen, ok))
+    return Score(correct, total, diff)
+
+
+def calculate_accuracy(expected, generated):
+    result = score(expected, generated)
+    return result.correct / result.total if result.total > 0 else 0
+
+
+def field_name(path):
+    return re.split(r'[.\[]', path, maxsplit=1)[0]
+
+
+def aggregate(pairs):
+    # Scores many (expected, generated) pairs at once. The per-leaf outcomes are collected in
+    # flat arrays and reduced with bincount, giving the overall (micro) accuracy, the mean
+    # per-pair (macro) accuracy and the accuracy of every top-level field.
+    pair_index, field_index, outcome = [], [], []
+    fields = {}
+    for i, (expected, generated) in enumerate(pairs):
+        for leaf in score(expected, generated).diff:
+            pair_index.append(i)
+            field_index.append(fields.setdefault(field_name(leaf.path), len(fields)))
+            outcome.append(leaf.correct)
+
+    if not outcome:
+        return {'pairs': len(pairs), 'accuracy': 0.0, 'macro_accuracy': 0.0, 'fields': {}}
+
+    pair_index = np.asarray(pair_index)
+    field_index = np.asarray(field_index)
+    outcome = np.asarray(outcome, dtype=np.float64)
+
+    pair_total = np.bincount(pair_index, minlength=len(pairs))
+    pair_correct = np.bincount(pair_index, weights=outcome, minlength=len(pairs))
+    field_total = np.bincount(field_index, minlength=len(fields))
+    field_correct = np.bincount(field_index, weights=outcome, minlength=len(fields))
+    scored = pair_total > 0
+
+    return {
+        'pairs': len(pairs),
+        'accuracy': float(outcome.mean()),
+        'macro_accuracy': float((pair_correct[scored] / pair_total[scored]).mean()),
+        'fields': {name: float(field_correct[k] / field_total[k]) for name, k in fields.items()},
+    }
@@ -1,14 +1,18 @@
 import time
 import openai
 import os
+import sys
 import json
 from dotenv import load_dotenv
 from prettytable import PrettyTable
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ollama', 'api'))
+from schema_compiler import compact_json_schema
+
 load_dotenv()  # Load environment variables from .env file
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
-base_dir = 'models'
+base_dir = os.path.dirname(os.path.abspath(__file__))
 subpastas = ['compras', 'creche', 'dados', 'feridas']
 schema_path = 'schema.json'
 
@@ -55,6 +59,11 @@ for subpasta in subpastas:
     subpasta_path = os.path.join(base_dir, subpasta)
     schema_file_path = os.path.join(subpasta_path, schema_path)
     print(schema_file_path)
+
+    # Compacted once per form: descriptions that only repeat the field name are dropped
+    with open(schema_file_path, 'r') as schema_file:
+        schema = compact_json_schema(json.load(schema_file))
+
     for i in range(1, 4):
         table = PrettyTable()
         table.field_names = ["Subpasta", "Tempo de Resposta"]
@@ -66,9 +75,6 @@ for subpasta in subpastas:
             print(f"Acessando os arquivos na pasta {subpasta}:")
             print(f" - {texto_path}")
 
-            with open(schema_file_path, 'r') as schema_file:
-                schema = json.load(schema_file)
-
             with open(texto_file_path, 'r') as texto_file:
                 texto = texto_file.read()
                 
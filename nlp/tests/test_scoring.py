@@ -0,0 +1,44 @@
+import pytest
+
+from scoring import aggregate, calculate_accuracy, score, values_equal
+
+
+@pytest.mark.parametrize('expected, generated', [
+    (65, 65.0), (65, '65'), ('1,5', 1.5), ('São Paulo', ' sao paulo.'), (None, None), (True, True),
+])
+def test_equal_values(expected, generated):
+    assert values_equal(expected, generated)
+
+
+@pytest.mark.parametrize('expected, generated', [
+    (1, True), (0, False), (None, ''), ('sim', True), (65, 66), ('a', ['a']),
+])
+def test_different_values(expected, generated):
+    assert not values_equal(expected, generated)
+
+
+def test_nested_leaves_are_scored_with_their_path():
+    expected = {'nome': 'Ana', 'tamanho': {'valor': 2, 'unidade': 'cm'}, 'idade': 40}
+    generated = {'nome': 'ana', 'tamanho': {'valor': 2.0, 'unidade': 'mm'}}
+    result = score(expected, generated)
+    assert (result.correct, result.total) == (2, 4)
+    assert [leaf.path for leaf in result.diff if not leaf.correct] == ['tamanho.unidade', 'idade']
+
+
+def test_lists_are_matched_regardless_of_order():
+    expected = {'alergias': ['pólen', 'ácaros', 'penicilina']}
+    result = score(expected, {'alergias': ['penicilina', 'acaros', 'gatos']})
+    assert (result.correct, result.total) == (2, 3)
+    assert calculate_accuracy(expected, {'alergias': ['penicilina', 'acaros', 'polen']}) == 1.0
+
+
+def test_aggregate_gives_micro_macro_and_per_field_accuracy():
+    pairs = [
+        ({'a': 1, 'b': 2}, {'a': 1, 'b': 2}),
+        ({'a': 1, 'b': 2, 'c': 3, 'd': 4}, {'a': 1}),
+    ]
+    result = aggregate(pairs)
+    assert result['accuracy'] == pytest.approx(3 / 6)
+    assert result['macro_accuracy'] == pytest.approx((1 + 0.25) / 2)
+    assert result['fields'] == {'a': 1.0, 'b': 0.5, 'c': 0.0, 'd': 0.0}
+    assert aggregate([])['accuracy'] == 0.0
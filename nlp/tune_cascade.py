@@ -0,0 +1,109 @@
+# Picks the CASCADE_THRESHOLD of the api's small-to-large cascade from benchmark runs.
+#
+#   python models.py --models llama3.2:3b,llama3:8b       (fills the store first)
+#   python tune_cascade.py [--small llama3.2:3b] [--large llama3:8b] [--prompt raw]
+#                          [--store results/runs.jsonl] [--max-loss 0.01]
+#
+# For every text with an expected_N.json and a successful run of both models, each field
+# of the small model's answer gets its confidence (ollama/api/cascade.py) and is scored
+# against the expected value, as is the large model's answer. Every threshold is then
+# simulated: fields under it take the large model's value. The table shows the accuracy,
+# the share of escalated fields and of requests answered by the small model alone, and an
+# estimate of the mean latency (small run, plus the large run when anything escalates).
+# The recommended threshold is the lowest one within --max-loss of the large model.
+import os
+import sys
+from prettytable import PrettyTable
+
+from models import base_dir, discover, load_store, run_key
+from scoring import score
+
+# models.py puts ollama/api on the path
+from cascade import field_confidence
+from schema_compiler import compile_schema
+
+THRESHOLDS = [round(i * 0.05, 2) for i in range(21)]
+
+
+def field_scores(expected, generated, name):
+    result = score({name: expected.get(name)}, {name: generated.get(name)})
+    return result.correct, result.total
+
+
+def collect(small, large, prompt, store_path):
+    # One entry per text: latencies and, per field, (confidence, small correct, large correct, leaves)
+    runs = load_store(store_path)
+    texts = []
+    for subpasta, texto_path, schema, texto, expected in discover():
+        small_run = runs.get(run_key(subpasta, texto_path, small, prompt))
+        large_run = runs.get(run_key(subpasta, texto_path, large, prompt))
+        if expected is None or not small_run or not large_run or small_run['status'] != 'ok' or large_run['status'] != 'ok':
+            continue
+
+        compiled = compile_schema(schema)
+        answer = small_run['generated'] if isinstance(small_run['generated'], dict) else {}
+        confidence = field_confidence(compiled.fields, answer, texto, compiled.validate(answer))
+        fields = []
+        for name in compiled.fields:
+            small_correct, total = field_scores(expected, answer, name)
+            large_correct, _ = field_scores(expected, large_run['generated'], name)
+            fields.append((confidence[name], small_correct, large_correct, total))
+        texts.append({'small_s': small_run['latency_s'], 'large_s': large_run['latency_s'], 'fields': fields})
+    return texts
+
+
+def simulate(texts, threshold):
+    correct = total = escalated = field_count = small_only = latency = 0
+    for text in texts:
+        doubtful = [field for field in text['fields'] if field[0] < threshold]
+        escalated += len(doubtful)
+        field_count += len(text['fields'])
+        small_only += not doubtful
+        latency += text['small_s'] + (text['large_s'] if doubtful else 0)
+        for confidence, small_correct, large_correct, leaves in text['fields']:
+            correct += large_correct if confidence < threshold else small_correct
+            total += leaves
+    return {
+        'threshold': threshold,
+        'accuracy': correct / total if total else 0.0,
+        'escalated_fields': escalated / field_count if field_count else 0.0,
+        'small_only_requests': small_only / len(texts) if texts else 0.0,
+        'mean_latency_s': latency / len(texts) if texts else 0.0,
+    }
+
+
+def main(small, large, prompt, store_path, max_loss):
+    texts = collect(small, large, prompt, store_path)
+    if not texts:
+        print(f"Sem runs de {small} e {large} ({prompt}) com expected em {store_path}")
+        return
+
+    large_only = simulate(texts, 1.01)
+    small_only = simulate(texts, 0)
+    rows = [simulate(texts, threshold) for threshold in THRESHOLDS]
+
+    table = PrettyTable()
+    table.field_names = list(rows[0].keys())
+    for row in rows:
+        table.add_row([f"{v:.3f}" if isinstance(v, float) else v for v in row.values()])
+    print(table)
+    print(f"{len(texts)} textos | só {small}: accuracy {small_only['accuracy']:.3f}, {small_only['mean_latency_s']:.2f}s"
+          f" | só {large}: accuracy {large_only['accuracy']:.3f}, {sum(t['large_s'] for t in texts) / len(texts):.2f}s")
+
+    good = [row for row in rows if row['accuracy'] >= large_only['accuracy'] - max_loss]
+    best = good[0] if good else max(rows, key=lambda row: row['accuracy'])
+    print(f"CASCADE_MODELS={small},{large} CASCADE_THRESHOLD={best['threshold']}"
+          f"  (accuracy {best['accuracy']:.3f}, {best['escalated_fields']:.0%} dos campos escalados,"
+          f" {best['small_only_requests']:.0%} dos pedidos só com {small})")
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    option = lambda name, default: args[args.index(name) + 1] if name in args else default
+    main(
+        option('--small', 'llama3.2:3b'),
+        option('--large', 'llama3:8b'),
+        option('--prompt', 'raw'),
+        option('--store', os.path.join(base_dir, 'results', 'runs.jsonl')),
+        float(option('--max-loss', 0.01)),
+    )
@@ -0,0 +1,51 @@
+import io
+import numpy as np
+import soundfile as sf
+import soxr
+
+SAMPLE_RATE = 16000
+
+
+def decode_audio(data):
+    # FLAC/WAV/OGG are decoded in-process by libsndfile; anything it does not understand
+    # (m4a, webm, ...) still goes through an ffmpeg pipe, but never through the disk.
+    try:
+        samples, rate = sf.read(io.BytesIO(data), dtype='float32', always_2d=True)
+    except RuntimeError:
+        # Imported here so that importing this module does not import transformers ahead of
+        # torch (see the int8 cache in backends.py)
+        from transformers.pipelines.audio_utils import ffmpeg_read
+        return ffmpeg_read(data, SAMPLE_RATE)
+
+    samples = samples.mean(axis=1) if samples.shape[1] > 1 else samples[:, 0]
+    if rate != SAMPLE_RATE:
+        samples = soxr.resample(samples, rate, SAMPLE_RATE)
+    return np.ascontiguousarray(samples, dtype=np.float32)
+
+
+def trim_silence(samples, frame_ms=30, margin_db=10.0, floor_db=-50.0, padding_ms=200):
+    # Energy based VAD: frames more than `margin_db` above the noise floor count as speech,
+    # each speech frame keeps `padding_ms` of context on both sides and everything else
+    # (leading/trailing dead air and long pauses) is cut out.
+    # Returns the kept audio and the number of seconds removed.
+    frame = SAMPLE_RATE * frame_ms // 1000
+    count = -(-len(samples) // frame)
+    if count == 0:
+        return samples, 0.0
+
+    frames = np.zeros(count * frame, dtype=np.float32)
+    frames[:len(samples)] = samples
+    frames = frames.reshape(count, frame)
+    energy = 10 * np.log10(np.mean(frames ** 2, axis=1) + 1e-10)
+
+    # Clips with no pause at all would otherwise put the threshold in the middle of the speech
+    threshold = min(np.percentile(energy, 10) + margin_db, energy.max() - 25.0)
+    speech = energy > max(threshold, floor_db)
+    if not speech.any():
+        return samples[:0], len(samples) / SAMPLE_RATE
+
+    pad = max(1, padding_ms // frame_ms)
+    keep = np.convolve(speech, np.ones(2 * pad + 1), mode='same') > 0
+    kept = np.repeat(keep, frame)[:len(samples)]
+    trimmed = samples[kept]
+    return trimmed, (len(samples) - len(trimmed)) / SAMPLE_RATE
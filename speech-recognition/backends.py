@@ -0,0 +1,83 @@
+import os
+import pickle
+import torch
+from transformers import AutoConfig, AutoModelForSpeechSeq2Seq, AutoProcessor, pipeline
+
+# MODEL_BACKEND values:
+#   torch - the checkpoint as published (fp16 on GPU, fp32 on CPU)
+#   int8  - PyTorch dynamic int8 quantization of the Linear layers, CPU only
+#   onnx  - the model exported to ONNX and run by ONNX Runtime (needs optimum[onnxruntime])
+BACKENDS = ('torch', 'int8', 'onnx')
+
+
+def load_model(model_id, backend, device, torch_dtype, cache_dir=None):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown MODEL_BACKEND '{backend}', expected one of {', '.join(BACKENDS)}")
+
+    # Converted models (ONNX export, quantized weights) are kept under cache_dir so a restart
+    # does not convert again; the plain checkpoint is already cached by huggingface_hub
+    cache_path = os.path.join(cache_dir, model_id.replace('/', '--'), backend) if cache_dir else None
+
+    if backend == 'onnx':
+        from optimum.onnxruntime import ORTModelForSpeechSeq2Seq
+
+        provider = 'CUDAExecutionProvider' if device.startswith('cuda') else 'CPUExecutionProvider'
+        if cache_path and os.path.isdir(cache_path):
+            return ORTModelForSpeechSeq2Seq.from_pretrained(cache_path, provider=provider)
+        model = ORTModelForSpeechSeq2Seq.from_pretrained(model_id, export=True, provider=provider)
+        if cache_path:
+            model.save_pretrained(cache_path)
+        return model
+
+    if backend == 'int8' and device != 'cpu':
+        raise ValueError("MODEL_BACKEND=int8 is only supported on CPU")
+
+    # Only the quantized tensors are cached, never a pickled module: the model is rebuilt
+    # from its config by the installed transformers and quantized the same way, then gets
+    # the saved weights. If they no longer fit (another transformers version) it is
+    # converted again from the checkpoint. Pickling the quantized tensors looks their qscheme
+    # up by name in every loaded module, so torch has to be imported before transformers,
+    # whose lazy model modules fail that lookup when an optional dependency is missing.
+    int8_weights = os.path.join(cache_path, 'int8_state_dict.pt') if cache_path else None
+    if backend == 'int8' and int8_weights and os.path.exists(int8_weights):
+        model = AutoModelForSpeechSeq2Seq.from_config(AutoConfig.from_pretrained(model_id), torch_dtype=torch_dtype, attn_implementation="sdpa")
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        try:
+            model.load_state_dict(torch.load(int8_weights, weights_only=True))
+            model.eval()
+            return model
+        except (RuntimeError, KeyError, pickle.UnpicklingError):
+            pass
+
+    model = AutoModelForSpeechSeq2Seq.from_pretrained(
+        model_id, torch_dtype=torch_dtype, low_cpu_mem_usage=True, use_safetensors=True, attn_implementation="sdpa"
+    )
+    if backend == 'int8':
+        model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        if int8_weights:
+            os.makedirs(cache_path, exist_ok=True)
+            torch.save(model.state_dict(), int8_weights)
+    else:
+        model.to(device)
+    model.eval()
+    return model
+
+
+def build_pipeline(model_id, backend='torch', cache_dir=None):
+    device = "cuda:0" if torch.cuda.is_available() else "cpu"
+    torch_dtype = torch.float16 if torch.cuda.is_available() else torch.float32
+
+    model = load_model(model_id, backend, device, torch_dtype, cache_dir)
+    processor = AutoProcessor.from_pretrained(model_id)
+
+    return pipeline(
+        "automatic-speech-recognition",
+        model=model,
+        tokenizer=processor.tokenizer,
+        feature_extractor=processor.feature_extractor,
+        torch_dtype=torch_dtype,
+        chunk_length_s=30,
+        batch_size=16,
+        # ONNX Runtime places the model itself through its execution provider
+        device=device if backend == 'torch' else None,
+    )
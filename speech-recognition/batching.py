@@ -0,0 +1,71 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from instrumentation import BATCH_SIZE, timed_stage
+
+
+class BatchScheduler:
+    # Sits in front of the pipeline so that concurrent requests share forward passes: the
+    # worker waits up to `max_wait_ms` for more requests, then hands all of them to the
+    # pipeline as a single list and the 30 s chunks of every input are batched together.
+    def __init__(self, pipe, max_batch_size=8, max_wait_ms=10):
+        self.pipe = pipe
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.requests = queue.Queue()
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    def __call__(self, inputs, **kwargs):
+        future = Future()
+        self.requests.put((inputs, kwargs, future))
+        return future.result()
+
+    def qsize(self):
+        return self.requests.qsize()
+
+    def _run(self):
+        while True:
+            batch = [self.requests.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.requests.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            # Only requests with the same call options can go through one pipeline call
+            groups = {}
+            for item in batch:
+                groups.setdefault(repr(sorted(item[1].items())), []).append(item)
+            for items in groups.values():
+                self._execute(items)
+
+    @staticmethod
+    def _fresh(inputs):
+        # The pipeline pops "raw" and "sampling_rate" out of a dict input, so every call gets
+        # its own copy and the inputs are still whole for the one-by-one retry
+        return dict(inputs) if isinstance(inputs, dict) else inputs
+
+    def _execute(self, items):
+        kwargs = items[0][1]
+        BATCH_SIZE.labels('whisper').observe(len(items))
+        try:
+            with timed_stage('inference'):
+                results = self.pipe([self._fresh(inputs) for inputs, _, _ in items], **kwargs)
+        except Exception:
+            # One bad upload must not fail everybody else in the batch
+            for inputs, _, future in items:
+                try:
+                    future.set_result(self.pipe(self._fresh(inputs), **kwargs))
+                except Exception as e:
+                    future.set_exception(e)
+            return
+
+        for (_, _, future), result in zip(items, results):
+            future.set_result(result)
@@ -0,0 +1,106 @@
+# Real-time factor, memory and WER of every MODEL_BACKEND on a fixed set of audio files.
+#
+#   python bench_backends.py <audio dir> [--backends torch,int8,onnx]
+#
+# The directory holds audio files (flac/wav/ogg/mp3) and, optionally, a .txt reference
+# transcript with the same name. Files without a reference are scored against the fp32
+# ("torch") transcript instead. Each backend runs in its own process so the RSS numbers
+# are not polluted by the previous model.
+import os
+import sys
+import json
+import time
+import subprocess
+import numpy as np
+
+from audio import SAMPLE_RATE, decode_audio
+
+AUDIO_EXTENSIONS = ('.flac', '.wav', '.ogg', '.mp3')
+
+
+def rss_mb():
+    # Current and peak RSS; /proc/self/status lists VmHWM (the peak) before VmRSS
+    with open('/proc/self/status') as f:
+        status = {line.split(':')[0]: int(line.split()[1]) / 1024 for line in f if line.startswith(('VmRSS', 'VmHWM'))}
+    return status['VmRSS'], status['VmHWM']
+
+
+def word_error_rate(reference, hypothesis):
+    reference, hypothesis = reference.lower().split(), hypothesis.lower().split()
+    if not reference:
+        return float(bool(hypothesis))
+    distances = list(range(len(hypothesis) + 1))
+    for i, ref_word in enumerate(reference, 1):
+        previous, distances[0] = distances[0], i
+        for j, hyp_word in enumerate(hypothesis, 1):
+            previous, distances[j] = distances[j], min(distances[j] + 1, distances[j - 1] + 1, previous + (ref_word != hyp_word))
+    return distances[-1] / len(reference)
+
+
+def run_backend(backend, audio_dir, model_id):
+    from backends import build_pipeline
+
+    files = sorted(f for f in os.listdir(audio_dir) if f.endswith(AUDIO_EXTENSIONS))
+    audio = {f: decode_audio(open(os.path.join(audio_dir, f), 'rb').read()) for f in files}
+    rss_before, _ = rss_mb()
+
+    start = time.perf_counter()
+    pipe = build_pipeline(model_id, backend)
+    load_time = time.perf_counter() - start
+    pipe({"raw": np.zeros(SAMPLE_RATE, dtype=np.float32), "sampling_rate": SAMPLE_RATE})
+
+    transcripts, inference_time = {}, 0.0
+    for name, samples in audio.items():
+        start = time.perf_counter()
+        transcripts[name] = pipe({"raw": samples, "sampling_rate": SAMPLE_RATE})["text"].strip()
+        inference_time += time.perf_counter() - start
+
+    rss_after, rss_peak = rss_mb()
+    audio_seconds = sum(len(samples) for samples in audio.values()) / SAMPLE_RATE
+    print(json.dumps({
+        'backend': backend,
+        'load_s': load_time,
+        'rtf': inference_time / audio_seconds if audio_seconds else 0.0,
+        'model_rss_mb': rss_after - rss_before,
+        'peak_rss_mb': rss_peak,
+        'transcripts': transcripts,
+    }))
+
+
+def main(audio_dir, backends, model_id):
+    references = {}
+    for f in os.listdir(audio_dir):
+        if f.endswith(AUDIO_EXTENSIONS):
+            txt = os.path.join(audio_dir, os.path.splitext(f)[0] + '.txt')
+            if os.path.exists(txt):
+                references[f] = open(txt, encoding='utf-8').read().strip()
+
+    results = {}
+    for backend in backends:
+        print(f"Running {backend}...", file=sys.stderr)
+        output = subprocess.run(
+            [sys.executable, __file__, audio_dir, '--worker', backend],
+            check=True, capture_output=True, text=True, env={**os.environ, 'MODEL_NAME': model_id},
+        ).stdout
+        results[backend] = json.loads(output.strip().splitlines()[-1])
+
+    baseline = results.get('torch', {}).get('transcripts', {})
+    print(f"{'backend':<8} {'load s':>8} {'RTF':>8} {'model MB':>10} {'peak MB':>10} {'WER':>8} {'WER vs fp32':>12}")
+    for backend, result in results.items():
+        transcripts = result['transcripts']
+        wer = [word_error_rate(references[f], t) for f, t in transcripts.items() if f in references]
+        wer_fp32 = [word_error_rate(baseline[f], t) for f, t in transcripts.items() if f in baseline]
+        print(f"{backend:<8} {result['load_s']:8.1f} {result['rtf']:8.3f} {result['model_rss_mb']:10.0f} {result['peak_rss_mb']:10.0f} "
+              f"{np.mean(wer) if wer else float('nan'):8.3f} {np.mean(wer_fp32) if wer_fp32 else float('nan'):12.3f}")
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    model_id = os.getenv('MODEL_NAME', default='openai/whisper-base')
+    if '--worker' in args:
+        run_backend(args[args.index('--worker') + 1], args[0], model_id)
+    else:
+        backends = ['torch', 'int8', 'onnx']
+        if '--backends' in args:
+            backends = args[args.index('--backends') + 1].split(',')
+        main(args[0], backends, model_id)
@@ -0,0 +1,85 @@
+# Compares the old temp-file decode path of /transcribe with the in-memory one.
+# Only the decode stage is measured: inference is the same for both paths.
+#
+#   python bench_decode.py [audio files...] [--runs N]
+#
+# Without files a 20 s synthetic FLAC is used. Syscall counts come from /proc/self/io
+# (read/write calls of this process); ffmpeg work is reported as child CPU time.
+import io
+import os
+import sys
+import time
+import resource
+import tempfile
+import numpy as np
+import soundfile as sf
+from transformers.pipelines.audio_utils import ffmpeg_read
+
+from audio import SAMPLE_RATE, decode_audio
+
+
+def proc_io():
+    with open('/proc/self/io') as f:
+        return {key: int(value) for key, value in (line.split(': ') for line in f)}
+
+
+def temp_file_path(data, temp_dir):
+    # What the endpoint used to do: save the upload, let the pipeline read it back
+    # and hand it to ffmpeg, then delete it
+    path = os.path.join(temp_dir, 'audio.flac')
+    with open(path, 'wb') as f:
+        f.write(data)
+    try:
+        with open(path, 'rb') as f:
+            return ffmpeg_read(f.read(), SAMPLE_RATE)
+    finally:
+        os.remove(path)
+
+
+def in_memory_path(data, temp_dir):
+    return decode_audio(data)
+
+
+def measure(name, decode, data, runs, temp_dir):
+    decode(data, temp_dir)
+    times = []
+    io_before = proc_io()
+    children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    for _ in range(runs):
+        start = time.perf_counter()
+        decode(data, temp_dir)
+        times.append(time.perf_counter() - start)
+    io_after = proc_io()
+    children_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    child_cpu = (children_after.ru_utime + children_after.ru_stime) - (children_before.ru_utime + children_before.ru_stime)
+    times = np.array(times) * 1000
+    print(f"{name:<12} p50={np.percentile(times, 50):8.2f} ms  p95={np.percentile(times, 95):8.2f} ms  "
+          f"read syscalls={(io_after['syscr'] - io_before['syscr']) / runs:7.1f}  "
+          f"write syscalls={(io_after['syscw'] - io_before['syscw']) / runs:7.1f}  "
+          f"bytes written={(io_after['wchar'] - io_before['wchar']) / runs:10.0f}  "
+          f"child cpu={child_cpu / runs * 1000:7.2f} ms")
+
+
+def synthetic_flac(seconds=20):
+    t = np.arange(int(seconds * 44100)) / 44100
+    samples = 0.1 * np.sin(2 * np.pi * 220 * t) + 0.01 * np.random.default_rng(0).standard_normal(len(t))
+    buffer = io.BytesIO()
+    sf.write(buffer, samples.astype(np.float32), 44100, format='FLAC')
+    return buffer.getvalue()
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    runs = 20
+    if '--runs' in args:
+        index = args.index('--runs')
+        runs = int(args[index + 1])
+        del args[index:index + 2]
+
+    inputs = [(path, open(path, 'rb').read()) for path in args] or [('synthetic 20 s flac', synthetic_flac())]
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for name, data in inputs:
+            print(f"{name} ({len(data)} bytes, {runs} runs)")
+            measure('temp file', temp_file_path, data, runs, temp_dir)
+            measure('in memory', in_memory_path, data, runs, temp_dir)
@@ -0,0 +1,120 @@
+# Throughput, latency and memory of the pre-forked server against the number of workers.
+#
+#   python bench_workers.py <audio file> [--workers 1,2,4] [--requests 64] [--clients 8]
+#                           [--port 6700]
+#
+# For every worker count a gunicorn server (gunicorn.conf.py) is started, and once every
+# worker is warmed up, --requests uploads of the audio file are sent to
+# /transcribe by --clients concurrent clients. Memory is read from /proc after the run:
+# RSS counts the shared weights once per process, PSS splits them between the processes
+# sharing them, so the PSS total is what the server really takes and "private" what every
+# worker adds on top of the shared model. Run it on an otherwise idle machine; the other
+# settings (MODEL_NAME, MODEL_BACKEND, TORCH_THREADS, ...) come from the environment.
+import os
+import sys
+import json
+import time
+import signal
+import threading
+import subprocess
+import numpy as np
+import requests
+from concurrent.futures import ThreadPoolExecutor
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+
+def memory_mb(pid):
+    # RSS, PSS and private memory of one process, from /proc/<pid>/smaps_rollup
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == 'kB':
+                fields[parts[0].rstrip(':')] = int(parts[1]) / 1024
+    return fields['Rss'], fields['Pss'], fields['Private_Clean'] + fields['Private_Dirty']
+
+
+def children(pid):
+    with open(f'/proc/{pid}/task/{pid}/children') as f:
+        return [int(child) for child in f.read().split()]
+
+
+def wait_ready(server, workers, timeout_s=900):
+    # Every worker prints cold_start_to_ready_s once it is warmed up (whisper.start_serving)
+    ready = set()
+    deadline = time.monotonic() + timeout_s
+    for line in server.stdout:
+        if line.startswith('{'):
+            event = json.loads(line)
+            if event.get('metric') == 'model_load_failed':
+                raise RuntimeError(event['error'])
+            if event.get('metric') == 'cold_start_to_ready_s':
+                ready.add(event['pid'])
+        if len(ready) >= workers:
+            return
+        if time.monotonic() > deadline:
+            break
+    raise RuntimeError(f'gunicorn exited or timed out with {len(ready)} of {workers} workers ready')
+
+
+def run(audio, workers, n_requests, clients, port):
+    url = f'http://127.0.0.1:{port}'
+    env = dict(os.environ, WORKERS=str(workers), BIND=f'127.0.0.1:{port}', PYTHONUNBUFFERED='1')
+    env.pop('PROMETHEUS_MULTIPROC_DIR', None)
+    server = subprocess.Popen(['gunicorn', '-c', 'gunicorn.conf.py', 'whisper:app'], cwd=here, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    try:
+        wait_ready(server, workers)
+        # Keep reading the output so a full pipe never blocks the workers
+        threading.Thread(target=server.stdout.read, daemon=True).start()
+
+        def transcribe(_):
+            start = time.perf_counter()
+            response = requests.post(f'{url}/transcribe', files={'file': ('audio', audio)}, timeout=600)
+            response.raise_for_status()
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=clients) as pool:
+            latencies = list(pool.map(transcribe, range(n_requests)))
+        wall = time.perf_counter() - start
+
+        master = memory_mb(server.pid)
+        worker_memory = [memory_mb(pid) for pid in children(server.pid)]
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=60)
+
+    return {
+        'workers': workers,
+        'req_s': n_requests / wall,
+        'p50_s': float(np.percentile(latencies, 50)),
+        'p95_s': float(np.percentile(latencies, 95)),
+        'rss_total_mb': master[0] + sum(m[0] for m in worker_memory),
+        'pss_total_mb': master[1] + sum(m[1] for m in worker_memory),
+        'private_per_worker_mb': sum(m[2] for m in worker_memory) / len(worker_memory),
+    }
+
+
+def main(audio_path, worker_counts, n_requests, clients, port):
+    with open(audio_path, 'rb') as f:
+        audio = f.read()
+
+    print(f"{n_requests} requests, {clients} clients, {os.cpu_count()} cpus")
+    for workers in worker_counts:
+        row = run(audio, workers, n_requests, clients, port)
+        print(f"workers={row['workers']:<3} {row['req_s']:6.2f} req/s  p50={row['p50_s']:6.2f} s  p95={row['p95_s']:6.2f} s  "
+              f"rss total={row['rss_total_mb']:8.0f} MB  pss total={row['pss_total_mb']:8.0f} MB  "
+              f"private/worker={row['private_per_worker_mb']:6.0f} MB")
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    option = lambda name, default: args[args.index(name) + 1] if name in args else default
+    main(
+        args[0],
+        [int(n) for n in option('--workers', '1,2,4').split(',')],
+        int(option('--requests', 64)),
+        int(option('--clients', 8)),
+        int(option('--port', 6700)),
+    )
@@ -0,0 +1,83 @@
+import os
+import json
+import time
+import requests
+
+from instrumentation import observe_stage
+
+# /fields of the NLP api (nlp/ollama/api), called from here so the phone only makes one
+# round trip for audio -> transcript -> filled form
+FIELDS_URL = os.getenv('FIELDS_URL', 'http://localhost:3000')
+
+
+def parse_server_timing(header):
+    # "load;dur=0.1, eval;dur=812.4" -> {"load_ms": 0.1, "eval_ms": 812.4}
+    timings = {}
+    for metric in (header or '').split(','):
+        name, _, duration = metric.strip().partition(';dur=')
+        if name and duration:
+            timings[f'{name}_ms'] = float(duration)
+    return timings
+
+
+class FieldsClient:
+    # One pooled keep-alive session to the NLP api per process
+    def __init__(self, base_url=FIELDS_URL):
+        self.base_url = base_url
+        self.timeout = (float(os.getenv('FIELDS_CONNECT_TIMEOUT', 5)), float(os.getenv('FIELDS_READ_TIMEOUT', 300)))
+        self.session = requests.Session()
+
+    def extract(self, text, schema=None, form=None):
+        # Returns the filled fields and the timings of the call (ours plus Ollama's)
+        start = time.monotonic()
+        response = self.session.post(f'{self.base_url}/fields', json={'schema': schema, 'form': form, 'text': text}, timeout=self.timeout)
+        response.raise_for_status()
+        fields = response.json()
+        # /fields answers with the JSON document encoded as a string
+        if isinstance(fields, str):
+            fields = json.loads(fields)
+        observe_stage('extract', time.monotonic() - start)
+        timings = {'extract_ms': round((time.monotonic() - start) * 1000, 1)}
+        timings.update({f'ollama_{name}': value for name, value in parse_server_timing(response.headers.get('Server-Timing')).items()})
+        return fields, timings
+
+
+class SpeculativeExtraction:
+    # While the user is still recording, the partial transcript is sent for extraction as
+    # soon as it stops changing between two decoding steps (usually a pause in speech). If
+    # the final transcript turns out to be that same text, its fields are already on the
+    # way when the recording ends; otherwise the final text is extracted as usual.
+    def __init__(self, client, executor, schema=None, form=None):
+        self.client = client
+        self.executor = executor
+        self.schema = schema
+        self.form = form
+        self.last_partial = None
+        self.text = None
+        self.future = None
+        self.started = 0
+
+    def update(self, text):
+        # Called with every partial transcript; returns True when an extraction was started
+        settled = text and text == self.last_partial and text != self.text
+        self.last_partial = text
+        if not settled:
+            return False
+        # At most one extraction per recording in flight: a superseded one still queued is
+        # dropped, and while one is already at the NLP api nothing new is sent (the next
+        # partial of the same pause tries again once it is done)
+        if self.future is not None and not self.future.done() and not self.future.cancel():
+            return False
+        self.text = text
+        self.future = self.executor.submit(self.client.extract, text, self.schema, self.form)
+        self.started += 1
+        return True
+
+    def result(self, text):
+        # Fields for the final transcript, and whether a speculative extraction was reused
+        if self.future is not None and text == self.text:
+            try:
+                return (*self.future.result(), True)
+            except requests.exceptions.RequestException:
+                pass
+        return (*self.client.extract(text, self.schema, self.form), False)
@@ -0,0 +1,65 @@
+# Production serving with pre-forked workers:
+#
+#   gunicorn -c gunicorn.conf.py whisper:app
+#
+# The app is imported and the model loaded once in the master (preload_app), then WORKERS
+# processes are forked from it: they share the weights copy-on-write instead of holding a
+# copy each, and every worker warms up and batches on its own. Each worker runs THREADS
+# request threads (websockets hold one for as long as they are open) and gets
+# TORCH_THREADS intra-op threads, by default the CPUs split evenly between the workers so
+# they do not oversubscribe the cores. `python whisper.py` still runs a single process.
+import gc
+import os
+import shutil
+
+cpus = len(os.sched_getaffinity(0))
+workers = int(os.getenv('WORKERS') or max(1, cpus // 2))
+threads = int(os.getenv('THREADS') or 8)
+torch_threads = int(os.getenv('TORCH_THREADS') or max(1, cpus // workers))
+
+bind = os.getenv('BIND', '0.0.0.0:6666')
+worker_class = 'gthread'
+preload_app = True
+# Long uploads take a while to transcribe
+timeout = 300
+graceful_timeout = 30
+
+# Read when whisper.py (and torch) are imported by preload_app, so it must be set here
+os.environ['WHISPER_PREFORK'] = '1'
+os.environ.setdefault('OMP_NUM_THREADS', str(torch_threads))
+os.environ.setdefault('MKL_NUM_THREADS', str(torch_threads))
+# Metrics of all the workers in one scrape (instrumentation.py). The directory is emptied
+# here, before the app is imported: files left by a previous run would be added to this
+# one's. Only on the first load, a reload (SIGHUP) keeps the live workers' files; a
+# PROMETHEUS_MULTIPROC_DIR given from outside is left as it is.
+if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+    os.environ['PROMETHEUS_MULTIPROC_DIR'] = '/tmp/whisper-metrics'
+    shutil.rmtree(os.environ['PROMETHEUS_MULTIPROC_DIR'], ignore_errors=True)
+    os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'])
+
+
+def when_ready(server):
+    # In the master, after the app was imported and before the first fork
+    import whisper
+    whisper.load_shared()
+    # Move everything loaded so far out of the collector's reach: a collection in a worker
+    # would otherwise write to every object header and copy the pages it shares
+    gc.collect()
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    import torch
+    import whisper
+    torch.set_num_threads(torch_threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Only allowed before the first parallel work of the process
+        pass
+    whisper.start_worker()
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,92 @@
+import numpy as np
+
+from audio import SAMPLE_RATE
+
+# Audio kept after a decode that heard nothing, in case a word is just starting
+SILENCE_TAIL_S = 1.0
+
+
+class StreamingTranscriber:
+    # Incremental transcription over a growing audio buffer. Every `step_s` seconds of new
+    # audio the unconfirmed part of the buffer is decoded again; segments that come out the
+    # same in two consecutive hypotheses are committed and their audio is dropped, so each
+    # decode only covers the last few seconds of speech.
+    def __init__(self, pipe, step_s=0.5, max_buffer_s=20.0):
+        self.pipe = pipe
+        self.step = int(step_s * SAMPLE_RATE)
+        self.max_buffer = int(max_buffer_s * SAMPLE_RATE)
+        self.buffer = np.zeros(0, dtype=np.float32)
+        self.leftover = b''
+        self.pending = 0
+        self.committed = []
+        self.previous = []
+
+    def feed_pcm16(self, data):
+        # Raw little-endian 16-bit mono PCM at 16 kHz; frames may split a sample in two
+        data = self.leftover + data
+        usable = len(data) - len(data) % 2
+        self.leftover = data[usable:]
+        samples = np.frombuffer(data[:usable], dtype='<i2').astype(np.float32) / 32768.0
+        return self.feed(samples)
+
+    def feed(self, samples):
+        self.buffer = np.concatenate([self.buffer, samples])
+        self.pending += len(samples)
+        if self.pending < self.step:
+            return []
+        self.pending = 0
+
+        segments = self._decode()
+        if not segments:
+            # Silence or a long pause: nothing to commit, and nothing worth decoding again
+            self.previous = []
+            self.buffer = self.buffer[-int(SILENCE_TAIL_S * SAMPLE_RATE):]
+            stable = 0
+        else:
+            stable = self._agreed(segments)
+            if not stable and len(self.buffer) > self.max_buffer:
+                # Nothing is settling down; force everything but the segment still being spoken
+                stable = len(segments) - 1 if len(segments) > 1 else len(segments)
+            self._commit(segments, stable)
+        # Whatever the hypotheses do, a decode never covers more than max_buffer_s
+        self.buffer = self.buffer[-self.max_buffer:]
+
+        return [{
+            'type': 'partial',
+            'stable': self.stable_text(),
+            'text': ' '.join(self.committed + [text for text, _ in segments[stable:]]).strip(),
+        }]
+
+    def finish(self):
+        if len(self.buffer):
+            segments = self._decode()
+            self._commit(segments, len(segments))
+        return {'type': 'final', 'text': self.stable_text()}
+
+    def stable_text(self):
+        return ' '.join(self.committed).strip()
+
+    def _decode(self):
+        result = self.pipe({'raw': self.buffer, 'sampling_rate': SAMPLE_RATE}, return_timestamps=True)
+        chunks = result.get('chunks') or [{'text': result['text'], 'timestamp': (0.0, None)}]
+        return [(chunk['text'].strip(), chunk['timestamp'][1]) for chunk in chunks if chunk['text'].strip()]
+
+    def _agreed(self, segments):
+        # The last segment is usually cut mid-word, so it is never committed here
+        count = 0
+        for (text, end), (previous_text, _) in zip(segments[:-1], self.previous):
+            if text != previous_text or end is None:
+                break
+            count += 1
+        return count
+
+    def _commit(self, segments, count):
+        self.previous = segments[count:]
+        if not count:
+            return
+        self.committed.extend(text for text, _ in segments[:count])
+        end = segments[count - 1][1]
+        if end is None or count == len(segments):
+            self.buffer = np.zeros(0, dtype=np.float32)
+        else:
+            self.buffer = self.buffer[int(end * SAMPLE_RATE):]
@@ -0,0 +1,7 @@
+import os
+import sys
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+# instrumentation.py, shared with the NLP api
+sys.path.append(os.path.join(APP_DIR, '..', 'common'))
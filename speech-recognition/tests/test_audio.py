@@ -0,0 +1,49 @@
+import io
+
+import numpy as np
+import soundfile as sf
+
+from audio import SAMPLE_RATE, decode_audio, trim_silence
+
+
+def tone(seconds, rate=SAMPLE_RATE, amplitude=0.5):
+    t = np.arange(int(seconds * rate)) / rate
+    return (amplitude * np.sin(2 * np.pi * 440 * t)).astype(np.float32)
+
+
+def noise(seconds, amplitude=0.001):
+    return (amplitude * np.random.default_rng(0).standard_normal(int(seconds * SAMPLE_RATE))).astype(np.float32)
+
+
+def test_wav_is_decoded_to_16khz_mono():
+    stereo = np.stack([tone(1.0, rate=44100), tone(1.0, rate=44100)], axis=1)
+    data = io.BytesIO()
+    sf.write(data, stereo, 44100, format='WAV')
+    samples = decode_audio(data.getvalue())
+    assert samples.dtype == np.float32
+    assert samples.ndim == 1
+    assert abs(len(samples) - SAMPLE_RATE) <= 1
+
+
+def test_dead_air_around_speech_is_cut_with_padding():
+    samples = np.concatenate([noise(1.0), tone(1.0), noise(1.0)])
+    trimmed, removed = trim_silence(samples, padding_ms=200)
+    # The tone and about 0.2 s of context on each side are kept
+    assert 1.3 <= len(trimmed) / SAMPLE_RATE <= 1.5
+    assert abs(removed - (len(samples) - len(trimmed)) / SAMPLE_RATE) < 1e-9
+
+
+def test_audio_without_pauses_is_kept_whole():
+    samples = tone(2.0)
+    trimmed, removed = trim_silence(samples)
+    assert len(trimmed) == len(samples)
+    assert removed == 0.0
+
+
+def test_silence_and_empty_audio():
+    trimmed, removed = trim_silence(np.zeros(SAMPLE_RATE, dtype=np.float32))
+    assert len(trimmed) == 0
+    assert removed == 1.0
+    trimmed, removed = trim_silence(np.zeros(0, dtype=np.float32))
+    assert len(trimmed) == 0
+    assert removed == 0.0
@@ -0,0 +1,48 @@
+import os
+
+import torch
+from transformers import AutoModelForSpeechSeq2Seq, WhisperConfig
+
+from backends import load_model
+
+
+def tiny_whisper(path):
+    config = WhisperConfig(
+        vocab_size=100, d_model=32, encoder_layers=1, decoder_layers=1, encoder_attention_heads=2, decoder_attention_heads=2,
+        encoder_ffn_dim=64, decoder_ffn_dim=64, pad_token_id=0, bos_token_id=1, eos_token_id=2, decoder_start_token_id=1,
+        max_source_positions=1500, max_target_positions=32,
+    )
+    AutoModelForSpeechSeq2Seq.from_config(config).save_pretrained(path)
+    return str(path)
+
+
+def logits(model):
+    torch.manual_seed(0)
+    features = torch.randn(1, 80, 3000)
+    with torch.no_grad():
+        return model(input_features=features, decoder_input_ids=torch.tensor([[1, 5, 7]])).logits
+
+
+def test_int8_cache_holds_weights_only_and_rebuilds_the_same_model(tmp_path):
+    model_id = tiny_whisper(tmp_path / 'model')
+    cache_dir = tmp_path / 'cache'
+    converted = load_model(model_id, 'int8', 'cpu', torch.float32, str(cache_dir))
+    cached_files = [os.path.join(root, name) for root, _, names in os.walk(cache_dir) for name in names]
+    assert len(cached_files) == 1
+    # Loads without unpickling arbitrary objects
+    torch.load(cached_files[0], weights_only=True)
+
+    rebuilt = load_model(model_id, 'int8', 'cpu', torch.float32, str(cache_dir))
+    assert torch.equal(logits(converted), logits(rebuilt))
+
+
+def test_int8_cache_that_does_not_fit_is_converted_again(tmp_path):
+    model_id = tiny_whisper(tmp_path / 'model')
+    cache_dir = tmp_path / 'cache'
+    load_model(model_id, 'int8', 'cpu', torch.float32, str(cache_dir))
+    cached, = [os.path.join(root, name) for root, _, names in os.walk(cache_dir) for name in names]
+    torch.save({'unexpected': torch.zeros(1)}, cached)
+
+    model = load_model(model_id, 'int8', 'cpu', torch.float32, str(cache_dir))
+    assert logits(model).shape == (1, 3, 100)
+    assert 'unexpected' not in torch.load(cached, weights_only=True)
@@ -0,0 +1,77 @@
+import threading
+
+import pytest
+
+from batching import BatchScheduler
+
+
+class FakePipe:
+    # Pops its inputs like the transformers pipeline does; an input named "bad" fails
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, inputs, **kwargs):
+        self.calls.append((len(inputs) if isinstance(inputs, list) else None, kwargs))
+        if isinstance(inputs, list):
+            return [self._one(item, kwargs) for item in inputs]
+        return self._one(inputs, kwargs)
+
+    def _one(self, inputs, kwargs):
+        name = inputs.pop('raw')
+        if name == 'bad':
+            raise ValueError('cannot decode')
+        return {'text': name, **kwargs}
+
+
+def call_together(scheduler, requests):
+    # Each (inputs, kwargs) from its own thread; the results or exceptions in the same order
+    results = [None] * len(requests)
+
+    def call(index, inputs, kwargs):
+        try:
+            results[index] = scheduler(inputs, **kwargs)
+        except Exception as e:
+            results[index] = e
+
+    threads = [threading.Thread(target=call, args=(index, *request)) for index, request in enumerate(requests)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    return results
+
+
+def test_concurrent_callers_share_one_call_and_get_their_own_result():
+    pipe = FakePipe()
+    scheduler = BatchScheduler(pipe, max_batch_size=8, max_wait_ms=200)
+    results = call_together(scheduler, [({'raw': f'audio {i}'}, {}) for i in range(4)])
+    assert results == [{'text': f'audio {i}'} for i in range(4)]
+    assert pipe.calls == [(4, {})]
+
+
+def test_a_failing_input_is_retried_alone_and_fails_only_its_caller():
+    pipe = FakePipe()
+    scheduler = BatchScheduler(pipe, max_batch_size=8, max_wait_ms=200)
+    results = call_together(scheduler, [({'raw': 'good'}, {}), ({'raw': 'bad'}, {}), ({'raw': 'also good'}, {})])
+    assert results[0] == {'text': 'good'}
+    assert isinstance(results[1], ValueError)
+    assert results[2] == {'text': 'also good'}
+    assert pipe.calls == [(3, {}), (None, {}), (None, {}), (None, {})]
+
+
+def test_only_calls_with_the_same_options_are_batched():
+    pipe = FakePipe()
+    scheduler = BatchScheduler(pipe, max_batch_size=8, max_wait_ms=200)
+    results = call_together(scheduler, [
+        ({'raw': 'a'}, {'return_timestamps': True}),
+        ({'raw': 'b'}, {}),
+        ({'raw': 'c'}, {'return_timestamps': True}),
+    ])
+    assert results == [{'text': 'a', 'return_timestamps': True}, {'text': 'b'}, {'text': 'c', 'return_timestamps': True}]
+    assert sorted(size for size, _ in pipe.calls) == [1, 2]
+
+
+def test_errors_reach_a_caller_that_is_alone():
+    scheduler = BatchScheduler(FakePipe(), max_wait_ms=1)
+    with pytest.raises(ValueError):
+        scheduler({'raw': 'bad'})
@@ -0,0 +1,77 @@
+import numpy as np
+
+from audio import SAMPLE_RATE
+from streaming import SILENCE_TAIL_S, StreamingTranscriber
+
+
+class FakePipe:
+    # Answers each decode with the next scripted hypothesis, a list of (text, end_s)
+    def __init__(self, hypotheses):
+        self.hypotheses = iter(hypotheses)
+        self.decoded = []
+
+    def __call__(self, inputs, return_timestamps=False):
+        self.decoded.append(len(inputs['raw']) / SAMPLE_RATE)
+        segments = next(self.hypotheses, [])
+        return {
+            'text': ' '.join(text for text, _ in segments),
+            'chunks': [{'text': f' {text}', 'timestamp': (0.0, end)} for text, end in segments],
+        }
+
+
+def seconds(count):
+    return np.zeros(int(count * SAMPLE_RATE), dtype=np.float32)
+
+
+def test_segments_agreed_twice_are_committed_and_their_audio_dropped():
+    pipe = FakePipe([
+        [('olá', 1.0), ('mun', None)],
+        [('olá', 1.0), ('mundo', 1.8)],
+        [('mundo', 0.8), ('tudo', None)],
+        [('tudo bem', 1.0)],
+    ])
+    transcriber = StreamingTranscriber(pipe, step_s=1.0)
+    assert transcriber.feed(seconds(1)) == [{'type': 'partial', 'stable': '', 'text': 'olá mun'}]
+    assert transcriber.feed(seconds(1)) == [{'type': 'partial', 'stable': 'olá', 'text': 'olá mundo'}]
+    # The committed second is gone, so the next decode only covers the last two
+    transcriber.feed(seconds(1))
+    assert pipe.decoded == [1.0, 2.0, 2.0]
+    assert transcriber.stable_text() == 'olá mundo'
+    assert transcriber.finish() == {'type': 'final', 'text': 'olá mundo tudo bem'}
+
+
+def test_nothing_is_decoded_before_a_whole_step():
+    pipe = FakePipe([])
+    transcriber = StreamingTranscriber(pipe, step_s=1.0)
+    assert transcriber.feed(seconds(0.4)) == []
+    assert transcriber.feed(seconds(0.4)) == []
+    assert pipe.decoded == []
+
+
+def test_silence_keeps_only_a_short_tail():
+    pipe = FakePipe([])
+    transcriber = StreamingTranscriber(pipe, step_s=1.0)
+    for _ in range(5):
+        transcriber.feed(seconds(1))
+        assert len(transcriber.buffer) <= SILENCE_TAIL_S * SAMPLE_RATE
+    assert max(pipe.decoded) <= SILENCE_TAIL_S + 1.0
+    assert transcriber.finish()['text'] == ''
+
+
+def test_hypotheses_that_never_settle_are_forced_out_at_max_buffer():
+    pipe = FakePipe([[(f'a{i}', 0.5), (f'b{i}', None)] for i in range(8)])
+    transcriber = StreamingTranscriber(pipe, step_s=1.0, max_buffer_s=3.0)
+    for _ in range(8):
+        transcriber.feed(seconds(1))
+        assert len(transcriber.buffer) <= 3.0 * SAMPLE_RATE
+    assert transcriber.committed
+    assert max(pipe.decoded) <= 4.0
+
+
+def test_pcm16_samples_split_across_frames_are_kept():
+    transcriber = StreamingTranscriber(FakePipe([]), step_s=1.0)
+    pcm = (np.arange(4, dtype='<i2') * 1000).tobytes()
+    transcriber.feed_pcm16(pcm[:3])
+    transcriber.feed_pcm16(pcm[3:])
+    assert transcriber.leftover == b''
+    assert np.allclose(transcriber.buffer * 32768.0, [0, 1000, 2000, 3000])
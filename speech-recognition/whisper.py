@@ -1,33 +1,171 @@
+import time
+started = time.monotonic()
+
 import os
-from flask import Flask, request, jsonify
-import torch
-from transformers import AutoModelForSpeechSeq2Seq, AutoProcessor, pipeline
-import os
+import io
+import sys
+import json
+import threading
+import numpy as np
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, Request, request, jsonify, g
+from flask_sock import Sock
 
-app = Flask(__name__)
+# instrumentation.py is shared with the NLP api: next to this file in the image, in common/
+# at the repo root in a checkout
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+
+from audio import SAMPLE_RATE, decode_audio, trim_silence
+from backends import build_pipeline
+from batching import BatchScheduler
+from form_filling import FieldsClient, SpeculativeExtraction
+from instrumentation import metrics, observe_stage, request_finished, request_started, track_queue
+from streaming import StreamingTranscriber
 
-device = "cuda:0" if torch.cuda.is_available() else "cpu"
-torch_dtype = torch.float16 if torch.cuda.is_available() else torch.float32
+
+class InMemoryRequest(Request):
+    # Werkzeug spools uploads bigger than 500 KB to a temporary file; keep them in memory
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return io.BytesIO()
+
+
+app = Flask(__name__)
+app.request_class = InMemoryRequest
+sock = Sock(app)
 
 model_id = os.getenv('MODEL_NAME', default='openai/whisper-base')
+model_backend = os.getenv('MODEL_BACKEND', default='torch')
+use_vad = os.getenv('VAD', '0') == '1'
+model_cache_dir = os.getenv('MODEL_CACHE_DIR')
+fields_client = FieldsClient()
+# Background extractions started on partial transcripts by /voice-to-form/stream
+speculation_pool = ThreadPoolExecutor(max_workers=int(os.getenv('SPECULATIVE_WORKERS', 4)))
+
+# The model is loaded in the background so the port is bound (and liveness answers) right
+# away; /transcribe answers 503 until the model is loaded and warmed up.
+pipe = None
+scheduler = None
+ready = threading.Event()
+load_error = None
+ready_after_s = None
+
+
+def load_model():
+    global pipe
+    pipe = build_pipeline(model_id, model_backend, model_cache_dir)
+
+
+def start_serving():
+    global scheduler, ready_after_s
+    scheduler = BatchScheduler(
+        pipe,
+        max_batch_size=int(os.getenv('BATCH_MAX_SIZE', 8)),
+        max_wait_ms=float(os.getenv('BATCH_MAX_WAIT_MS', 10)),
+    )
+    track_queue('whisper_batch', scheduler.qsize)
+    # The first forward pass is much slower than the rest; pay for it before serving
+    noise = np.random.default_rng(0).normal(0, 0.01, 2 * SAMPLE_RATE).astype(np.float32)
+    scheduler({"raw": noise, "sampling_rate": SAMPLE_RATE})
+
+    ready_after_s = time.monotonic() - started
+    ready.set()
+    print(json.dumps({"metric": "cold_start_to_ready_s", "value": round(ready_after_s, 3), "model": model_id, "backend": model_backend, "pid": os.getpid()}))
+
+
+def load(*steps):
+    global load_error
+    load_error = None
+    try:
+        for step in steps:
+            step()
+    except Exception as e:
+        load_error = str(e)
+        print(json.dumps({"metric": "model_load_failed", "model": model_id, "backend": model_backend, "error": load_error}))
+
+
+# Pre-fork serving (gunicorn -c gunicorn.conf.py whisper:app): the master calls load_shared()
+# before forking and every worker calls start_worker() right after, so the weights are
+# loaded once and shared copy-on-write by all the workers. Nothing may run the model in the
+# master: the OpenMP thread pool of a forward pass does not survive a fork. ONNX Runtime
+# sessions do not either, so with that backend each worker loads its own copy. Batching
+# (BatchScheduler) is per worker.
+def load_shared():
+    if model_backend != 'onnx':
+        load(load_model)
+
+
+def start_worker():
+    load(*([load_model] if pipe is None else []), start_serving)
+
+
+if os.getenv('WHISPER_PREFORK') != '1':
+    threading.Thread(target=load, args=(load_model, start_serving), daemon=True).start()
+
+
+def not_ready():
+    response = jsonify({"error": load_error or "Model is still loading"})
+    response.headers['Retry-After'] = '5'
+    return response, 503
+
+
+@app.before_request
+def start_request_metrics():
+    # Labelled by route, not by path, so the number of series stays bounded
+    g.metrics = request_started(request.url_rule.rule if request.url_rule else 'unmatched', request.headers)
+
+
+@app.after_request
+def record_request_metrics(response):
+    if 'metrics' in g:
+        request_finished(g.pop('metrics'), request.method, response.status_code)
+    return response
+
+
+@app.teardown_request
+def record_failed_request_metrics(error=None):
+    # after_request is skipped when the view raised
+    if 'metrics' in g:
+        request_finished(g.pop('metrics'), request.method, 500)
 
-model = AutoModelForSpeechSeq2Seq.from_pretrained(
-    model_id, torch_dtype=torch_dtype, low_cpu_mem_usage=True, use_safetensors=True, attn_implementation="sdpa"
-)
-model.to(device)
 
-processor = AutoProcessor.from_pretrained(model_id)
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    body, content_type = metrics()
+    return body, 200, {'Content-Type': content_type}
 
-pipe = pipeline(
-    "automatic-speech-recognition",
-    model=model,
-    tokenizer=processor.tokenizer,
-    feature_extractor=processor.feature_extractor,
-    torch_dtype=torch_dtype,
-    chunk_length_s=30,
-    batch_size=16,
-    device=device,
-)
+
+@app.route('/health/live', methods=['GET'])
+def health_live():
+    return jsonify({"status": "alive"})
+
+
+@app.route('/health/ready', methods=['GET'])
+def health_ready():
+    if not ready.is_set():
+        return not_ready()
+    return jsonify({"status": "ready", "model": model_id, "backend": model_backend, "ready_after_s": ready_after_s})
+
+
+def elapsed_ms(since):
+    return round((time.monotonic() - since) * 1000, 1)
+
+
+def transcribe_upload(audio_file, response, timings):
+    start = time.monotonic()
+    audio = decode_audio(audio_file.read())
+    timings["decode_ms"] = elapsed_ms(start)
+    if use_vad:
+        start = time.monotonic()
+        audio, response["silence_removed_s"] = trim_silence(audio)
+        timings["vad_ms"] = elapsed_ms(start)
+    start = time.monotonic()
+    # A clip that is all silence does not need the model at all
+    transcription = scheduler({"raw": audio, "sampling_rate": SAMPLE_RATE})["text"] if len(audio) else ""
+    timings["stt_ms"] = elapsed_ms(start)
+    for name, ms in timings.items():
+        observe_stage(name[:-3], ms / 1000)
+    return transcription
 
 
 @app.route('/transcribe', methods=['POST'])
@@ -35,23 +173,150 @@ def transcribe():
     print(request)
     if 'file' not in request.files:
         return jsonify({"error": "No file provided"}), 400
+    if not ready.is_set():
+        return not_ready()
+
+    response = {}
+    try:
+        response["transcription"] = transcribe_upload(request.files['file'], response, {})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    return jsonify(response)
+
+
+def form_target(data):
+    # The form to fill: a schema (JSON, or a JSON string in a multipart field) or the id of
+    # a form the NLP api knows
+    schema = data.get('schema')
+    if isinstance(schema, str):
+        schema = json.loads(schema)
+    return schema, data.get('form')
+
+
+def extraction_error(e):
+    if isinstance(e, requests.exceptions.Timeout):
+        return f"Extraction timed out: {e}", 504
+    if isinstance(e, requests.exceptions.HTTPError):
+        return f"Extraction failed: {e.response.status_code} {e.response.text[:200]}", 502
+    return f"Extraction failed: {e}", 502
 
-    audio_file = request.files['file']
-    temp_file_path = os.path.join('temp', audio_file.filename)
 
-    audio_file.save(temp_file_path)
+# Audio in, filled form out: multipart with the audio in "file" and either "schema" or
+# "form". Transcription and extraction happen in one request, the response carries the
+# transcript, the fields and how long each stage took.
+@app.route('/voice-to-form', methods=['POST'])
+def voice_to_form():
+    if 'file' not in request.files:
+        return jsonify({"error": "No file provided"}), 400
+    try:
+        schema, form = form_target(request.form)
+    except ValueError:
+        return jsonify({"error": "Schema is not valid JSON"}), 400
+    if schema is None and not form:
+        return jsonify({"error": "A schema or a form id is required"}), 400
+    if not ready.is_set():
+        return not_ready()
 
+    start = time.monotonic()
+    response = {}
+    timings = {}
     try:
-        result = pipe(temp_file_path)
-        transcription = result["text"]
+        response["transcription"] = transcribe_upload(request.files['file'], response, timings)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
-    finally:
-        os.remove(temp_file_path)
 
-    return jsonify({"transcription": transcription})
+    try:
+        response["fields"], extract_timings = fields_client.extract(response["transcription"], schema, form)
+        timings.update(extract_timings)
+    except requests.exceptions.RequestException as e:
+        # The transcript is still worth returning, the client can retry /fields with it
+        error, status = extraction_error(e)
+        return jsonify({**response, "error": error}), status
+
+    timings["total_ms"] = elapsed_ms(start)
+    response["timings"] = timings
+    print(json.dumps({"endpoint": "/voice-to-form", **timings}))
+    return jsonify(response), 200, {"Server-Timing": ', '.join(f"{name[:-3]};dur={value}" for name, value in timings.items() if name.endswith('_ms'))}
+
+
+# Streaming mode: the client sends binary frames of 16 kHz mono PCM16 while recording and a
+# text frame ("end") when it stops. Partial transcripts are pushed back as they stabilize,
+# followed by a single final message.
+@sock.route('/transcribe/stream')
+def transcribe_stream(ws):
+    if not ready.is_set():
+        ws.send(json.dumps({"type": "error", "error": load_error or "Model is still loading"}))
+        return
+
+    transcriber = StreamingTranscriber(
+        scheduler,
+        step_s=float(os.getenv('STREAM_STEP_S', 0.5)),
+        max_buffer_s=float(os.getenv('STREAM_MAX_BUFFER_S', 20)),
+    )
+    while True:
+        message = ws.receive()
+        if message is None or isinstance(message, str):
+            break
+        try:
+            for event in transcriber.feed_pcm16(message):
+                ws.send(json.dumps(event))
+        except Exception as e:
+            ws.send(json.dumps({"type": "error", "error": str(e)}))
+            return
+
+    ws.send(json.dumps(transcriber.finish()))
+
+
+# Streaming version of /voice-to-form: the first frame is a text frame with the form
+# ({"schema": ...} or {"form": ...}), then the same PCM16 frames and "end" as in
+# /transcribe/stream. Partial transcripts that settle are extracted in the background while
+# the user is still talking, so the final message (transcript, fields and timings) usually
+# only waits for the last decode.
+@sock.route('/voice-to-form/stream')
+def voice_to_form_stream(ws):
+    if not ready.is_set():
+        ws.send(json.dumps({"type": "error", "error": load_error or "Model is still loading"}))
+        return
+    try:
+        schema, form = form_target(json.loads(ws.receive()))
+    except (TypeError, ValueError, AttributeError):
+        ws.send(json.dumps({"type": "error", "error": "The first frame must be a JSON object with a schema or a form id"}))
+        return
+
+    transcriber = StreamingTranscriber(
+        scheduler,
+        step_s=float(os.getenv('STREAM_STEP_S', 0.5)),
+        max_buffer_s=float(os.getenv('STREAM_MAX_BUFFER_S', 20)),
+    )
+    speculation = SpeculativeExtraction(fields_client, speculation_pool, schema, form)
+    while True:
+        message = ws.receive()
+        if message is None or isinstance(message, str):
+            break
+        try:
+            for event in transcriber.feed_pcm16(message):
+                speculation.update(event['text'])
+                ws.send(json.dumps(event))
+        except Exception as e:
+            ws.send(json.dumps({"type": "error", "error": str(e)}))
+            return
+
+    start = time.monotonic()
+    final = transcriber.finish()
+    timings = {"stt_ms": elapsed_ms(start)}
+    try:
+        fields, extract_timings, reused = speculation.result(final["text"])
+    except requests.exceptions.RequestException as e:
+        ws.send(json.dumps({**final, "error": extraction_error(e)[0]}))
+        return
+    timings.update(extract_timings)
+    # Time the client waited after "end", the rest overlapped with the recording
+    timings["after_end_ms"] = elapsed_ms(start)
+    timings["speculative"] = {"started": speculation.started, "reused": reused}
+    print(json.dumps({"endpoint": "/voice-to-form/stream", **timings}))
+    ws.send(json.dumps({**final, "fields": fields, "timings": timings}))
+
 
 if __name__ == '__main__':
-    os.makedirs('temp', exist_ok=True)
-    
     app.run(host='0.0.0.0', port=6666)
\ No newline at end of file